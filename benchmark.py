@@ -0,0 +1,141 @@
+from datastructures.avltree import AVLTree
+from datastructures.intervaltree import IntervalTree
+from datastructures.stock import Stock
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+# Reproducible benchmarks for IntervalTree and the AVLTree under it. Rows come from a seeded generator shaped like
+# synthetic_stock_data.csv (same tickers, lows from $50 to $350, a year of dates), with a tunable share of
+# exact duplicates and a tunable maximum interval width. Each operation is timed call by call so the
+# JSON report carries ops/sec, p50 and p99 latency, and the build steps are re-run under tracemalloc to
+# record peak memory. bulk_load is a single call, so it reports no latency percentiles. AVLTree is
+# timed on its own keyed insert/search/delete, with each row keyed by (low, high, row number) so keys
+# are unique. A plain list scan answers the same point/range queries as the baseline.
+#
+#   python benchmark.py --scales 1000,10000,100000 --output bench.json
+
+TICKERS = [('AAPL', 'Apple Inc.'), ('ADBE', 'Adobe Inc.'), ('AMZN', 'Amazon.com Inc.'), ('BABA', 'Alibaba Group'),
+           ('CRM', 'Salesforce Inc.'), ('CSCO', 'Cisco Systems'), ('DIS', 'Walt Disney Co.'), ('GOOGL', 'Alphabet Inc.'),
+           ('IBM', 'International Business Machines'), ('INTC', 'Intel Corp.'), ('META', 'Meta Platforms'),
+           ('MSFT', 'Microsoft Corp.'), ('NFLX', 'Netflix Inc.'), ('NVDA', 'NVIDIA Corp.'), ('ORCL', 'Oracle Corp.'),
+           ('PINS', 'Pinterest Inc.'), ('SNAP', 'Snap Inc.'), ('SPOT', 'Spotify Technology'), ('TSLA', 'Tesla Inc.'),
+           ('UBER', 'Uber Technologies')]
+FIRST_DATE = date(2023, 10, 22)
+
+def generate_stocks(count: int, duplicate_rate: float = 0.05, max_width: int = 340, seed: int = 351) -> List[Stock]:
+    rng = random.Random(seed)
+    stocks: List[Stock] = []
+    for _ in range(count):
+        if stocks and rng.random() < duplicate_rate:
+            twin = rng.choice(stocks)       # same ticker, same band, another day
+            stocks.append(Stock(twin.symbol, twin.name, twin.low, twin.high, FIRST_DATE + timedelta(days=rng.randrange(366))))
+            continue
+        symbol, name = rng.choice(TICKERS)
+        low = rng.randint(50, 350)
+        stocks.append(Stock(symbol, name, low, low + rng.randint(10, max(10, max_width)), FIRST_DATE + timedelta(days=rng.randrange(366))))
+    return stocks
+
+def _percentile(ordered: Sequence[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def _time_calls(function: Callable, arguments: Iterable[tuple]) -> Dict[str, float]:
+    latencies = []
+    for argument in arguments:
+        started = time.perf_counter_ns()
+        function(*argument)
+        latencies.append(time.perf_counter_ns() - started)
+    total = sum(latencies) / 1e9
+    latencies.sort()
+    return dict(ops=len(latencies), seconds=total, ops_per_sec=len(latencies) / total if total else 0.0,
+                p50_us=_percentile(latencies, 0.50) / 1e3, p99_us=_percentile(latencies, 0.99) / 1e3)
+
+def _peak_memory(build: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        build()
+        return tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+
+def run_scale(count: int, duplicate_rate: float, max_width: int, seed: int, queries: int, k: int,
+              measure_memory: bool = True, baseline_limit: int = 1_000_000) -> List[Dict]:
+    stocks = generate_stocks(count, duplicate_rate, max_width, seed)
+    rows = [(stock.low, stock.high, stock) for stock in stocks]
+    rng = random.Random(seed + count)
+    points = [rng.randint(40, 700) for _ in range(queries)]
+    ranges = [(point, point + rng.randint(1, 50)) for point in points]
+    results: List[Dict] = []
+
+    def record(operation: str, engine: str, timings: Dict[str, float], peak: Optional[int] = None):
+        results.append(dict(scale=count, operation=operation, engine=engine, peak_bytes=peak, **timings))
+
+    def insert_all() -> IntervalTree:
+        tree = IntervalTree()
+        for row in rows: tree.insert(*row)
+        return tree
+
+    tree = IntervalTree()
+    handles = []
+    record('insert', 'IntervalTree', _time_calls(lambda *row: handles.append(tree.insert(*row)), rows),
+           _peak_memory(insert_all) if measure_memory else None)
+
+    started = time.perf_counter()
+    bulk = IntervalTree.bulk_load(rows)
+    seconds = time.perf_counter() - started
+    record('bulk_load', 'IntervalTree', dict(ops=count, seconds=seconds, ops_per_sec=count / seconds if seconds else 0.0,
+                                             p50_us=None, p99_us=None),
+           _peak_memory(lambda: IntervalTree.bulk_load(rows)) if measure_memory else None)
+
+    record('point_search', 'IntervalTree', _time_calls(bulk.search, ((point,) for point in points)))
+    record('range_search', 'IntervalTree', _time_calls(bulk.search, ranges))
+    record('top_k', 'IntervalTree', _time_calls(bulk.top_k, [(k,)] * queries))
+    record('bottom_k', 'IntervalTree', _time_calls(bulk.bottom_k, [(k,)] * queries))
+    rng.shuffle(handles)
+    record('delete', 'IntervalTree', _time_calls(tree.delete, ((handle,) for handle in handles)))
+
+    avl = AVLTree()
+    keys = [(stock.low, stock.high, number) for number, stock in enumerate(stocks)]
+    record('insert', 'AVLTree', _time_calls(avl.insert, ((key, stock) for key, stock in zip(keys, stocks))))
+    record('search', 'AVLTree', _time_calls(avl.search, ((rng.choice(keys),) for _ in range(queries))))
+    rng.shuffle(keys)
+    record('delete', 'AVLTree', _time_calls(avl.delete, ((key,) for key in keys)))
+
+    if count <= baseline_limit:
+        scan = list(stocks)
+        record('point_search', 'list_scan', _time_calls(lambda p: [s for s in scan if s.low <= p <= s.high], ((point,) for point in points)))
+        record('range_search', 'list_scan', _time_calls(lambda start, end: [s for s in scan if s.low <= end and s.high >= start], ranges))
+        record('top_k', 'list_scan', _time_calls(lambda k: sorted(scan, key=lambda s: (s.low, s.high), reverse=True)[:k], [(k,)] * max(1, queries // 10)))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IntervalTree and AVLTree against a brute-force list scan.")
+    parser.add_argument('--scales', default='1000,10000,100000', help="comma separated row counts, e.g. 1e3,1e4,1e7")
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help="share of rows repeating an earlier (low, high)")
+    parser.add_argument('--max-width', type=int, default=340, help="largest high - low of a generated interval")
+    parser.add_argument('--seed', type=int, default=351)
+    parser.add_argument('--queries', type=int, default=1000, help="queries timed per search operation")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc re-runs of the build steps")
+    parser.add_argument('--baseline-limit', type=int, default=1_000_000, help="largest scale to also run the list scan on")
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    report = dict(meta=dict(python=platform.python_version(), platform=platform.platform(), seed=args.seed,
+                            duplicate_rate=args.duplicate_rate, max_width=args.max_width, queries=args.queries, k=args.k),
+                  results=[])
+    def _us(value: Optional[float]) -> str: return f"{value:>10.1f}us" if value is not None else f"{'-':>12}"
+
+    for scale in [int(float(scale)) for scale in args.scales.split(',')]:
+        scale_results = run_scale(scale, args.duplicate_rate, args.max_width, args.seed, args.queries, args.k,
+                                  not args.no_memory, args.baseline_limit)
+        report['results'].extend(scale_results)
+        for result in scale_results:
+            print(f"{result['scale']:>10} {result['operation']:<13} {result['engine']:<13} {result['ops_per_sec']:>14,.0f} ops/s"
+                  f"  p50 {_us(result['p50_us'])}  p99 {_us(result['p99_us'])}")
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
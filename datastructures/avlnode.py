@@ -4,30 +4,22 @@ from typing import Generic, Optional
 from datastructures.iavltree import K, V
 
 class AVLNode(Generic[K, V]):
+    # Slotted with plain attributes: no per-node __dict__ and no property call on every key/child access 
+    # in the tree's hot loops.
+    __slots__ = ('key', 'value', 'left', 'right', 'height', 'size', 'aggregate')
+
     def __init__(self, key: K, value: V, left: Optional[AVLNode]=None, right: Optional[AVLNode]=None):
-        self._key: K = key
-        self._value: V = value
-        self._left: Optional[AVLNode] = left
-        self._right: Optional[AVLNode] = right
-        self._height: int = 1
+        self.key: K = key
+        self.value: V = value
+        self.left: Optional[AVLNode] = left
+        self.right: Optional[AVLNode] = right
+        self.height: int = 1
+        self.size: int = 1      # number of nodes in this subtree, for rank/select
+        self.aggregate: Optional[tuple] = None     # the tree's monoid aggregates over this subtree, if it has any
 
-    @property 
-    def key(self) -> K: return self._key
-    @key.setter
-    def key(self, key: K) -> None: self._key = key
-    @property
-    def value(self) -> V: return self._value
-    @value.setter
-    def value(self, value: V) -> None: self._value = value
-    @property
-    def left(self) -> Optional[AVLNode]: return self._left
-    @left.setter
-    def left(self, left: Optional[AVLNode]) -> None: self._left = left
-    @property
-    def right(self) -> Optional[AVLNode]: return self._right
-    @right.setter
-    def right(self, right: Optional[AVLNode]) -> None: self._right = right
-    @property
-    def height(self) -> int: return self._height
-    @height.setter
-    def height(self, height: int) -> None: self._height = height
\ No newline at end of file
+    def copy(self) -> AVLNode:
+        # shallow copy for the persistent trees' path copying; subclasses with extra slots extend it
+        clone = object.__new__(type(self))
+        clone.key, clone.value, clone.left, clone.right = self.key, self.value, self.left, self.right
+        clone.height, clone.size, clone.aggregate = self.height, self.size, self.aggregate
+        return clone
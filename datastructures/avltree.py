@@ -1,61 +1,180 @@
 from __future__ import annotations
-from typing import Callable, Generic, List, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Generic, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
+import copy
+
+from datastructures import instrumentation
 from datastructures.iavltree import IAVLTree, K, V
 from datastructures.avlnode import AVLNode
 from collections import deque
 
+class Monoid(NamedTuple):
+    # A per-subtree aggregate: measure gives one node's own value, combine joins the values of two
+    # neighbouring key ranges (left range first) and identity is the value of an empty range.
+    measure: Callable[[AVLNode], Any]
+    combine: Callable[[Any, Any], Any]
+    identity: Any
+
 class AVLTree(IAVLTree[K, V], Generic[K, V]):
-    def __init__(self, starting_sequence: Optional[Sequence[Tuple[K, V]]]=None) -> None: 
+    def __init__(self, starting_sequence: Optional[Sequence[Tuple[K, V]]]=None, persistent: bool=False, 
+                 aggregates: Optional[Dict[str, Monoid]]=None) -> None: 
         self._root: Optional[AVLNode] = None
         self._size: int = 0
-        for key, value in starting_sequence or []: self.insert(key, value)
+        self.persistent = persistent    # copy-on-write updates, see snapshot
+        self.aggregates: Dict[str, Monoid] = dict(aggregates or {})     # see range_aggregate
+        self._monoids: Tuple[Monoid, ...] = tuple(self.aggregates.values())
+        pairs = list(starting_sequence or [])
+        if all(pairs[i - 1][0] < pairs[i][0] for i in range(1, len(pairs))): self._build(pairs)  # already sorted, skip the inserts
+        else: 
+            for key, value in pairs: self.insert(key, value)
+
+    @classmethod
+    def from_sorted(cls, pairs: Sequence[Tuple[K, V]], persistent: bool=False, 
+                    aggregates: Optional[Dict[str, Monoid]]=None) -> AVLTree[K, V]:
+        pairs = list(pairs)
+        for i in range(1, len(pairs)):
+            if pairs[i][0] == pairs[i - 1][0]: raise KeyError(f"Key {pairs[i][0]} already exists in the tree.")
+            if pairs[i][0] < pairs[i - 1][0]: raise ValueError("from_sorted requires pairs in ascending key order")
+        tree = cls(persistent=persistent, aggregates=aggregates)
+        tree._build(pairs)
+        return tree
+
+    def _build(self, pairs: List[Tuple[K, V]]) -> None:
+        # Builds a perfectly balanced tree in O(n) by rooting each range at its middle pair. Heights 
+        # (and any subclass augmentation) are filled in bottom-up by _update, so no rotations are needed.
+        def _build_range(lo: int, hi: int) -> Optional[AVLNode]:
+            if lo >= hi: return None
+            mid = (lo + hi) // 2
+            node = self._new_node(*pairs[mid])
+            node.left = _build_range(lo, mid)
+            node.right = _build_range(mid + 1, hi)
+            self._update(node)
+            return node
+
+        self._root = _build_range(0, len(pairs))
+        self._size = len(pairs)
 
+    # insert, search and delete are iterative: a single descent records the path (and which side was 
+    # taken at each step), and _retrace walks it back up re-linking, updating and rebalancing.
     def insert(self, key: K, value: V) -> None:
-        def _insert(node: Optional[AVLNode], key: K, value: V) -> AVLNode:
-            if not node: return AVLNode(key, value)
-            elif key < node.key: node.left = _insert(node.left, key, value)
-            else: node.right = _insert(node.right, key, value)
+        path: List[AVLNode] = []
+        sides: List[bool] = []     # True where the descent went left
+        node = self._root
+        while node:
+            if key == node.key: raise KeyError(f"Key {key} already exists in the tree.")
+            path.append(node)
+            sides.append(key < node.key)
+            node = node.left if key < node.key else node.right
 
-            node.height = 1 + max(AVLTree._node_height(node.left), AVLTree._node_height(node.right))
-            return AVLTree._balance_tree(node)
-    
-        if self.search(key): raise KeyError(f"Key {key} already exists in the tree.")
-        self._root = _insert(self._root, key, value)
+        if instrumentation.probe: instrumentation.probe.count(visited=len(path), comparisons=len(path))
+        if self.persistent: self._copy_path(path, sides)
+        leaf = self._new_node(key, value)
+        if self._monoids: self._update(leaf)
+        self._retrace(path, sides, leaf)
         self._size += 1
 
     def search(self, key: K) -> Optional[V]:
-        def _search(root: Optional[AVLNode], key: K) -> Optional[V]:
-            if not root: return None
-            
-            if key == root.key: return root.value
-            elif key < root.key: return _search(root.left, key)
-            else: return _search(root.right, key)
-            
-        return _search(self._root, key)
+        if instrumentation.probe: return self._counted_search(key)
+        node = self._root
+        while node:
+            if key == node.key: return node.value
+            node = node.left if key < node.key else node.right
+        return None
+
+    def _counted_search(self, key: K) -> Optional[V]:
+        # search with the probe's counters, kept apart so the plain loop above pays nothing for them
+        visited = 0
+        node = self._root
+        while node:
+            visited += 1
+            if key == node.key: break
+            node = node.left if key < node.key else node.right
+        instrumentation.probe.count(visited=visited, comparisons=visited)
+        return node.value if node else None
         
     def delete(self, key: K) -> None:
-        def _delete(root: Optional[AVLNode], key: K) -> Optional[AVLNode]:
-            if not root: return root
-            
-            if key < root.key: root.left = _delete(root.left, key)
-            elif key > root.key: root.right = _delete(root.right, key)
-            else:
-                if not root.left or not root.right: root = root.left or root.right
-                else:
-                    successor: AVLNode[K, V] = AVLTree._find_successor(root.right)
-                    root.key = successor.key
-                    root.value = successor.value
-                    root.right = _delete(root.right, successor.key)
-            if root: 
-                root.height = 1 + max(AVLTree._node_height(root.left), AVLTree._node_height(root.right))        
-                return AVLTree._balance_tree(root)
-            
-            return None # tree is now empty
-
-        self._root = _delete(self._root, key)
+        path: List[AVLNode] = []
+        sides: List[bool] = []
+        node = self._root
+        while node and key != node.key:
+            path.append(node)
+            sides.append(key < node.key)
+            node = node.left if key < node.key else node.right
+        if instrumentation.probe: instrumentation.probe.count(visited=len(path) + bool(node), comparisons=len(path) + bool(node))
+        if not node: raise KeyError(f"Key {key} not found in the tree.")
+
+        if not node.left or not node.right: 
+            if self.persistent: self._copy_path(path, sides)
+            replacement = node.left or node.right
+        else:
+            # relink the successor node in place of the deleted one rather than copying its key/value, 
+            # so any extra per-node data a subclass keeps travels with it
+            at = len(path)
+            path.append(node)
+            sides.append(False)
+            successor = node.right
+            while successor.left:
+                path.append(successor)
+                sides.append(True)
+                successor = successor.left
+            if self.persistent:
+                self._copy_path(path, sides)
+                node, successor = path[at], successor.copy()
+            replacement = successor.right
+            if len(path) > at + 1: successor.right = node.right     # the successor sat deeper than node.right
+            successor.left = node.left
+            successor.height = node.height
+            path[at] = successor
+            if instrumentation.probe: instrumentation.probe.count(visited=len(path) - at)
+            self._link(path, sides, at, successor)
+
+        self._retrace(path, sides, replacement)
         self._size -= 1
 
+    def _retrace(self, path: List[AVLNode], sides: List[bool], child: Optional[AVLNode]) -> None:
+        # Hangs child under the last node of path, then updates and rebalances each node on the way back 
+        # up. Once a node keeps both its place and its height nothing above it can change shape, so the 
+        # rebalancing stops there and the remaining ancestors only get their sizes (and any subclass 
+        # augmentation) refreshed. The root is assigned once, at the very end, which is what publishes a 
+        # persistent tree's new version.
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            if sides[i]: node.left = child
+            else: node.right = child
+            height = node.height
+            self._update(node)
+            child = self._balance_tree(node)
+            if child is node and node.height == height:
+                for ancestor in reversed(path[:i]): self._update(ancestor)
+                self._root = path[0]
+                return
+        self._root = child
+
+    def _link(self, path: List[AVLNode], sides: List[bool], i: int, node: Optional[AVLNode]) -> None:
+        # path[0] becomes the root in _retrace
+        if i == 0: return
+        if sides[i - 1]: path[i - 1].left = node
+        else: path[i - 1].right = node
+
+    # Persistent mode. Updates never modify a node that is already part of the tree: the descent path 
+    # is replaced by fresh copies (and rotations copy the nodes they move), so an update allocates 
+    # O(log(n)) nodes, shares every other subtree with the previous version, and only becomes visible 
+    # when _retrace assigns the new root. A reader that took the root before that keeps a complete, 
+    # unchanging tree, and old versions are garbage collected once nothing references their root.
+    # Writers still need to be serialized with each other.
+    def _copy_path(self, path: List[AVLNode], sides: List[bool]) -> None:
+        for i, node in enumerate(path):
+            path[i] = node = node.copy()
+            self._link(path, sides, i, node)
+
+    def snapshot(self) -> AVLTree[K, V]:
+        # A tree sharing the current version's nodes. In persistent mode it never changes, can be read 
+        # from any thread without locking, and writing to it forks a new version instead of touching this one.
+        root = self._root
+        view = copy.copy(self)
+        view._root, view._size = root, root.size if root else 0
+        return view
+
     def inorder(self, visit: Optional[Callable[[V], None]]=None) -> List[K]:
         def _inorder(node: Optional[AVLNode]):
             if not node: 
@@ -104,6 +223,138 @@ class AVLTree(IAVLTree[K, V], Generic[K, V]):
 
         return keys
 
+    # Lazy traversals: an explicit stack holds at most one root-to-leaf path, descending straight to the 
+    # starting bound, so pulling k pairs costs O(log(n) + k) time and O(log(n)) memory.
+    def iter_inorder(self, lo: Optional[K]=None, hi: Optional[K]=None) -> Iterator[Tuple[K, V]]:
+        if instrumentation.probe: return self._counted_iter(lo, hi, False)
+        return self._iter_inorder(lo, hi)
+
+    def iter_reversed(self, hi: Optional[K]=None, lo: Optional[K]=None) -> Iterator[Tuple[K, V]]:
+        if instrumentation.probe: return self._counted_iter(hi, lo, True)
+        return self._iter_reversed(hi, lo)
+
+    def _iter_inorder(self, lo: Optional[K], hi: Optional[K]) -> Iterator[Tuple[K, V]]:
+        stack: List[AVLNode] = []
+        node = self._root
+        while stack or node:
+            while node:
+                if lo is not None and node.key < lo: node = node.right     # node and its left subtree are below lo
+                else:
+                    stack.append(node)
+                    node = node.left
+            if not stack: return
+            node = stack.pop()
+            if hi is not None and hi < node.key: return
+            yield node.key, node.value
+            node = node.right
+
+    def _iter_reversed(self, hi: Optional[K], lo: Optional[K]) -> Iterator[Tuple[K, V]]:
+        stack: List[AVLNode] = []
+        node = self._root
+        while stack or node:
+            while node:
+                if hi is not None and hi < node.key: node = node.left      # node and its right subtree are above hi
+                else:
+                    stack.append(node)
+                    node = node.right
+            if not stack: return
+            node = stack.pop()
+            if lo is not None and node.key < lo: return
+            yield node.key, node.value
+            node = node.left
+
+    def _counted_iter(self, first: Optional[K], last: Optional[K], reverse: bool) -> Iterator[Tuple[K, V]]:
+        # either traversal with the probe's counters, kept apart so the plain loops above pay nothing for
+        # them; the nodes walked are reported once the iterator finishes or is closed
+        stack: List[AVLNode] = []
+        node = self._root
+        visited = 0
+        try:
+            while stack or node:
+                while node:
+                    visited += 1
+                    if first is not None and (first < node.key if reverse else node.key < first): node = node.left if reverse else node.right
+                    else:
+                        stack.append(node)
+                        node = node.right if reverse else node.left
+                if not stack: return
+                node = stack.pop()
+                if last is not None and (node.key < last if reverse else last < node.key): return
+                yield node.key, node.value
+                node = node.left if reverse else node.right
+        finally:
+            if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+
+    def items(self) -> Iterator[Tuple[K, V]]: return self.iter_inorder()
+
+    # Order statistics from the subtree sizes, each a single O(log(n)) descent.
+    def rank(self, key: K, inclusive: bool=False) -> int:
+        # number of keys below key (or at most key when inclusive)
+        rank = 0
+        node = self._root
+        while node:
+            if key < node.key or (key == node.key and not inclusive): node = node.left
+            else:
+                rank += 1 + (node.left.size if node.left else 0)
+                node = node.right
+        return rank
+
+    def select(self, i: int) -> K:
+        if not 0 <= i < self._size: raise IndexError(f"Index {i} out of range for a tree of size {self._size}.")
+        node = self._root
+        while node:
+            left_size = node.left.size if node.left else 0
+            if i == left_size: return node.key
+            if i < left_size: node = node.left
+            else:
+                i -= left_size + 1
+                node = node.right
+
+    def count_range(self, lo: K, hi: K) -> int:
+        return max(0, self.rank(hi, inclusive=True) - self.rank(lo))
+
+    # Monoid aggregates. Every node keeps, in node.aggregate, one value per configured monoid over its
+    # whole subtree, recomputed by _update wherever sizes are (inserts, deletes, rotations, builds). 
+    # range_aggregate then covers [lo, hi] with the node where the two bounds split plus the subtrees 
+    # hanging inside the bounds along the two paths below it: O(log(n)) nodes, whatever the range holds.
+    def range_aggregate(self, lo: K, hi: K) -> Dict[str, Any]:
+        if not self._monoids: raise ValueError("This tree has no aggregates configured.")
+        identity = tuple(monoid.identity for monoid in self._monoids)
+        node = self._root
+        visited = 0
+        while node and not lo <= node.key <= hi:
+            visited += 1
+            node = node.left if hi < node.key else node.right
+        if not node:
+            if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+            return dict(zip(self.aggregates, identity))
+
+        left = right = identity
+        walk = node.left
+        visited += 1
+        while walk:
+            visited += 1
+            if walk.key >= lo:
+                # walk and its right subtree are in range, and come before everything gathered so far
+                left = self._combine(self._measure(walk), self._combine(walk.right.aggregate if walk.right else identity, left))
+                walk = walk.left
+            else: walk = walk.right
+        walk = node.right
+        while walk:
+            visited += 1
+            if walk.key <= hi:
+                right = self._combine(self._combine(right, walk.left.aggregate if walk.left else identity), self._measure(walk))
+                walk = walk.right
+            else: walk = walk.left
+        if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+        return dict(zip(self.aggregates, self._combine(self._combine(left, self._measure(node)), right)))
+
+    def _measure(self, node: AVLNode) -> tuple:
+        return tuple(monoid.measure(node) for monoid in self._monoids)
+
+    def _combine(self, first: tuple, second: tuple) -> tuple:
+        return tuple(monoid.combine(a, b) for monoid, a, b in zip(self._monoids, first, second))
+
     def size(self) -> int: return self._size
 
     def __str__(self) -> str:
@@ -121,64 +372,66 @@ class AVLTree(IAVLTree[K, V], Generic[K, V]):
         traversals = [self.bforder(), self.inorder(), self.preorder(), self.postorder()]
         return f'{"\n".join([f'{desc} {"".join(str(trav))}' for desc, trav in zip(descriptions, traversals)])}\n\n{str(self)}' 
    
-    @staticmethod
-    def _balance_tree(node: AVLNode) -> AVLNode:
-        # Left rotation (LL)
-        if AVLTree._balance_factor(node) > 1 and node.left and AVLTree._balance_factor(node.left) >= 0:
-            return AVLTree._rotate_right(node)
+    # Balancing and rotations are instance methods so that subclasses can carry extra per-node 
+    # data (e.g. the interval tree's max_end) by overriding _new_node and _update.
+    def _new_node(self, key: K, value: V) -> AVLNode: return AVLNode(key, value)
 
-        # Right rotation (RR)
-        if AVLTree._balance_factor(node) < -1 and node.right and AVLTree._balance_factor(node.right) <= 0:
-            return AVLTree._rotate_left(node)
+    def _update(self, node: AVLNode) -> None:
+        left, right = node.left, node.right
+        node.height = 1 + max(left.height if left else 0, right.height if right else 0)
+        node.size = 1 + (left.size if left else 0) + (right.size if right else 0)
+        if self._monoids:
+            aggregate = self._measure(node)
+            if left: aggregate = self._combine(left.aggregate, aggregate)
+            if right: aggregate = self._combine(aggregate, right.aggregate)
+            node.aggregate = aggregate
 
-        # Left-Right rotation (LR)
-        if AVLTree._balance_factor(node) > 1 and node.left and AVLTree._balance_factor(node.left) < 0:
-            node.left = AVLTree._rotate_left(node.left)
-            return AVLTree._rotate_right(node)
+    def _balance_tree(self, node: AVLNode) -> AVLNode:
+        balance = AVLTree._balance_factor(node)
+        if balance > 1:
+            # Left-Right rotation (LR) first straightens the left child, then Left rotation (LL)
+            if AVLTree._balance_factor(node.left) < 0: node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
 
-        # Right-Left rotation (RL)
-        if AVLTree._balance_factor(node) < -1 and node.right and AVLTree._balance_factor(node.right) > 0:
-            node.right = AVLTree._rotate_right(node.right)
-            return AVLTree._rotate_left(node)
+        if balance < -1:
+            # Right-Left rotation (RL) first straightens the right child, then Right rotation (RR)
+            if AVLTree._balance_factor(node.right) > 0: node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
 
         return node 
 
-    @staticmethod
-    def _rotate_left(node: AVLNode) -> AVLNode:
+    def _rotate_left(self, node: AVLNode) -> AVLNode:
         new_root = node.right
         if not new_root: raise ValueError("new_root cannot be None for left rotation")
+        if instrumentation.probe: instrumentation.probe.count(rotations=1)
+        if self.persistent: node, new_root = node.copy(), new_root.copy()
 
         new_left_subtree = new_root.left
 
         new_root.left = node
         node.right = new_left_subtree
 
-        node.height = 1 + max(AVLTree._node_height(node.left), AVLTree._node_height(node.right))
-        new_root.height = 1 + max(AVLTree._node_height(new_root.left), AVLTree._node_height(new_root.right))
+        self._update(node)
+        self._update(new_root)
 
         return new_root
     
-    @staticmethod
-    def _rotate_right(node: AVLNode) -> AVLNode:
+    def _rotate_right(self, node: AVLNode) -> AVLNode:
         new_root = node.left
         if not new_root: raise ValueError("new_root cannot be None for right rotation")
+        if instrumentation.probe: instrumentation.probe.count(rotations=1)
+        if self.persistent: node, new_root = node.copy(), new_root.copy()
 
         new_right_subtree = new_root.right
 
         new_root.right = node
         node.left = new_right_subtree
 
-        node.height = 1 + max(AVLTree._node_height(node.left), AVLTree._node_height(node.right))
-        new_root.height = 1 + max(AVLTree._node_height(new_root.left), AVLTree._node_height(new_root.right))
+        self._update(node)
+        self._update(new_root)
 
         return new_root
     
-    @staticmethod
-    def _find_successor(node: AVLNode) -> AVLNode:
-        current = node
-        while current.left: current = current.left
-        return current
-
     @staticmethod
     def _node_height(node: Optional[AVLNode]) -> int: return node.height if node else 0
 
@@ -188,4 +441,6 @@ class AVLTree(IAVLTree[K, V], Generic[K, V]):
     @staticmethod
     def _visit(node: AVLNode, result: List[K], visit: Optional[Callable[[V], None]] = None) -> None:
         visit and visit(node.value)
-        result.append(node.key)
\ No newline at end of file
+        result.append(node.key)
+
+instrumentation.register(AVLTree, 'insert', 'search', 'delete', 'range_aggregate')
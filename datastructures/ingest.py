@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import csv
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from datastructures.intervaltree import IntervalTree
+from datastructures.stock import Stock
+
+
+# Streams stock rows out of one or more CSV files (symbol, name, low, high[, date]) in fixed-size
+# chunks. Each field is converted exactly once, so the Stock objects already hold ints and a date,
+# and the whole load goes into the tree through IntervalTree.bulk_load rather than one insert per
+# row. Rows that cannot be parsed are recorded in the stats and skipped instead of aborting the load.
+
+Source = Union[str, os.PathLike]
+
+@dataclass
+class MalformedRow:
+    source: str
+    line: int
+    row: List[str]
+    error: str
+
+@dataclass
+class IngestStats:
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    malformed: List[MalformedRow] = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> float: return self.rows / self.seconds if self.seconds else 0.0
+    @property
+    def bytes_per_sec(self) -> float: return self.bytes / self.seconds if self.seconds else 0.0
+    def __repr__(self):
+        return f'{self.rows} rows ({len(self.malformed)} malformed), {self.bytes} bytes in {self.seconds:.3f}s: ' \
+               f'{self.rows_per_sec:,.0f} rows/sec, {self.bytes_per_sec:,.0f} bytes/sec'
+
+def parse_row(row: List[str]) -> Stock:
+    if len(row) not in (4, 5): raise ValueError(f"expected 4 or 5 fields, got {len(row)}")
+    symbol, name, low, high = row[:4]
+    stock = Stock(symbol, name, int(low), int(high), date.fromisoformat(row[4]) if len(row) == 5 and row[4] else None)
+    if stock.low > stock.high: raise ValueError(f"low {stock.low} is above high {stock.high}")
+    return stock
+
+def read_stocks(sources: Union[Source, Iterable[Source]], chunk_size: int = 65536, stats: Optional[IngestStats] = None,
+                select: Optional[Callable[[str], bool]] = None) -> Iterator[List[Stock]]:
+    # select, if given, is called with each row's raw symbol field; rows it rejects are skipped unparsed
+    def _lines(csvfile, undecodable):
+        # a line that is not valid UTF-8 is passed on with replacement characters and its error kept
+        # by line number, so its row is recorded as malformed instead of aborting the load
+        for number, line in enumerate(csvfile, 1):
+            stats.bytes += len(line)
+            try: yield line.decode('utf-8')
+            except UnicodeDecodeError as error:
+                undecodable[number] = error
+                yield line.decode('utf-8', errors='replace')
+
+    stats = stats if stats is not None else IngestStats()
+    sources = [sources] if isinstance(sources, (str, os.PathLike)) else sources
+    started = time.perf_counter()
+    chunk: List[Stock] = []
+    for source in sources:
+        with open(source, 'rb') as csvfile:
+            undecodable = {}
+            reader = csv.reader(_lines(csvfile, undecodable))
+            for row in reader:
+                if not row or (select and not select(row[0])): continue
+                try:
+                    if reader.line_num in undecodable: raise undecodable[reader.line_num]    # UnicodeDecodeError is a ValueError
+                    chunk.append(parse_row(row))
+                except ValueError as error:
+                    stats.malformed.append(MalformedRow(str(source), reader.line_num, row, str(error)))
+                    continue
+                stats.rows += 1
+                if len(chunk) >= chunk_size:
+                    stats.seconds = time.perf_counter() - started
+                    yield chunk
+                    chunk = []
+    stats.seconds = time.perf_counter() - started
+    if chunk: yield chunk
+
+def load_interval_tree(sources: Union[Source, Iterable[Source]], chunk_size: int = 65536,
+                       stats: Optional[IngestStats] = None) -> IntervalTree:
+    stats = stats if stats is not None else IngestStats()
+    started = time.perf_counter()
+    rows = [(stock.low, stock.high, stock) for chunk in read_stocks(sources, chunk_size, stats) for stock in chunk]
+    tree = IntervalTree.bulk_load(rows)
+    stats.seconds = time.perf_counter() - started
+    return tree
+
+def load_static_index(sources: Union[Source, Iterable[Source]], chunk_size: int = 65536,
+                      stats: Optional[IngestStats] = None):
+    # imported here so the rest of the ingestion path does not need NumPy installed
+    from datastructures.staticintervalindex import StaticIntervalIndex
+
+    stats = stats if stats is not None else IngestStats()
+    started = time.perf_counter()
+    index = StaticIntervalIndex.from_stocks(stock for chunk in read_stocks(sources, chunk_size, stats) for stock in chunk)
+    stats.seconds = time.perf_counter() - started
+    return index
+
+def load_time_index(sources: Union[Source, Iterable[Source]], bucket_days: int = 7, chunk_size: int = 65536,
+                    stats: Optional[IngestStats] = None):
+    from datastructures.timeintervalindex import TimeIntervalIndex
+
+    stats = stats if stats is not None else IngestStats()
+    started = time.perf_counter()
+    index = TimeIntervalIndex.from_stocks((stock for chunk in read_stocks(sources, chunk_size, stats) for stock in chunk), bucket_days)
+    stats.seconds = time.perf_counter() - started
+    return index
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Optional per-operation counters for AVLTree and IntervalTree: nodes visited, key comparisons,
+# rotations and results returned. Nothing is counted unless instrument() is active. The trees only check
+# the module-level probe at coarse points (once per descent or rotation, or inside the interval query
+# walks), and the wrappers that open and close an operation record are only patched onto the
+# registered methods while instrument() is active, so a disabled probe adds almost nothing to the hot
+# paths. Operations nested inside another one (e.g. the AVLTree.insert that an IntervalTree.insert
+# performs) are folded into the outer operation's record.
+#
+#   with instrument(print) as probe:    # the callback gets every finished OpStats
+#       tree.search(155)
+#   probe.totals['IntervalTree.search'].pruning
+#
+# Probes are not thread safe; instrument one thread's workload at a time.
+
+@dataclass
+class OpStats:
+    operation: str
+    calls: int = 0
+    visited: int = 0
+    comparisons: int = 0
+    rotations: int = 0
+    results: int = 0
+
+    def add(self, other: OpStats) -> None:
+        for counter in ('calls', 'visited', 'comparisons', 'rotations', 'results'):
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+
+    @property
+    def pruning(self) -> float:
+        # results per node visited: close to (or above) 1 means the walk only touched what matched
+        return self.results / self.visited if self.visited else 0.0
+
+class Probe:
+    def __init__(self, callback: Optional[Callable[[OpStats], None]] = None):
+        self.callback = callback
+        self.totals: Dict[str, OpStats] = {}
+        self.overall = OpStats('overall')
+        self._current: Optional[OpStats] = None
+        self._depth = 0
+
+    def begin(self, operation: str) -> None:
+        if not self._depth: self._current = OpStats(operation, calls=1)
+        self._depth += 1
+
+    def end(self, results: int = 0) -> None:
+        self._depth -= 1
+        if self._depth: return
+        finished, self._current = self._current, None
+        finished.results += results
+        self.totals.setdefault(finished.operation, OpStats(finished.operation)).add(finished)
+        self.overall.add(finished)
+        if self.callback: self.callback(finished)
+
+    def count(self, visited: int = 0, comparisons: int = 0, rotations: int = 0) -> None:
+        current = self._current or self.totals.setdefault('(unscoped)', OpStats('(unscoped)'))
+        current.visited += visited
+        current.comparisons += comparisons
+        current.rotations += rotations
+        if not self._current:
+            self.overall.visited += visited
+            self.overall.comparisons += comparisons
+            self.overall.rotations += rotations
+
+probe: Optional[Probe] = None
+_registry: List[Tuple[type, str, bool]] = []
+
+def register(cls: type, *names: str, returns_count: bool = False) -> None:
+    # returns_count: the method returns a count (or a list of counts) rather than a list of results
+    _registry.extend((cls, name, returns_count) for name in names)
+
+def _results(result: Any, returns_count: bool) -> int:
+    if returns_count: return sum(result) if isinstance(result, list) else result or 0
+    if isinstance(result, list): return sum(map(len, result)) if result and isinstance(result[0], list) else len(result)
+    if isinstance(result, str): return result.count('\n')     # fancy output: one line per result after the title
+    return 0 if result is None else 1
+
+def _wrap(operation: str, method: Callable, returns_count: bool) -> Callable:
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        active = probe
+        active.begin(operation)
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        finally: active.end(_results(result, returns_count))
+    return wrapper
+
+@contextmanager
+def instrument(callback: Optional[Callable[[OpStats], None]] = None) -> Iterator[Probe]:
+    global probe
+    if probe: raise RuntimeError("instrumentation is already active")
+    originals = [(cls, name, cls.__dict__[name]) for cls, name, _ in _registry]
+    probe = Probe(callback)
+    try:
+        for cls, name, returns_count in _registry:
+            setattr(cls, name, _wrap(f'{cls.__name__}.{name}', cls.__dict__[name], returns_count))
+        yield probe
+    finally:
+        for cls, name, original in originals: setattr(cls, name, original)
+        probe = None
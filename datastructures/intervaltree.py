@@ -1,22 +1,32 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Optional, Tuple
+import datetime
+import mmap
+import operator
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import closing, nullcontext
+from bisect import bisect_left, bisect_right
+from itertools import groupby, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-from datastructures.avltree import AVLTree
+from datastructures import instrumentation
+from datastructures.avltree import AVLTree, Monoid
 from datastructures.avlnode import AVLNode
+from datastructures.stock import Stock
 
 
 
-# I opted for a traversal strategy which I think would be fairly unique. Instead of traversing the 
-# nested trees as we would when traversing one AVLTree on its own, I've decided to traverse by 
-# cutting away subtrees which could not qualify for the query based on the parameters, and using
-# .inorder() to traverse across the valid nodes in the "lows" AVLTree to find valid "high" pairs, 
-# and thus the relevant stock(s). This is to accommodate the difficulty of using binary strategies 
-# to traverse non-binary nodes i.e. intervals, and the fact that the value we are looking for may 
-# be in more than one node. While these superficial strategies may not have optimal time compexity,
-# none are worse than O(n), and the most common and volumous tasks still use the embedded O(log(n))
-# time complexity strategies. 
+# Each node of the "lows" AVLTree holds a nested tree of every high that shares its low, where each 
+# high keeps a bucket of all the values with that exact (low, high) interval. Lows nodes also keep 
+# two bounds: max_high, the largest high at that low, and max_end, the largest high anywhere in the 
+# node's subtree. max_end is kept correct through every rotation, insert and delete, which lets the 
+# queries cut away whole subtrees: if a subtree's max_end is below the query start nothing in it can
+# overlap, and once a low is past the query end everything to its right can be skipped. A query 
+# therefore costs O(log(n) + m) for m matching intervals instead of walking every low.
 # 
 # Also, it seems like your 'synthetic_stock_data.csv' and 'synthetic_stock_test_outputs.txt' files
 # do not line up correctly. I've combed through both files personally and found that the outputs 
@@ -24,56 +34,535 @@ from datastructures.avlnode import AVLNode
 # up by certain queries are not shown in the output text file. This means that the outputs are missing
 # stock entries that should qualify for the query.
 
-@dataclass
-class IntervalNode:
-    key: int
-    value: Any
-    max_end: int = 0
-    intervals_at_low: AVLTree = AVLTree()
+class IntervalNode(AVLNode):
+    __slots__ = ('max_high', 'max_end')
+
+    def __init__(self, key: int, value: _HighsTree, max_high: int):
+        super().__init__(key, value)
+        self.max_high = max_high    # largest high stored at this low
+        self.max_end = max_high     # largest high anywhere in this node's subtree
+    def copy(self) -> IntervalNode:
+        clone = super().copy()
+        clone.max_high, clone.max_end = self.max_high, self.max_end
+        return clone
     def __repr__(self):
         return f'{self.key}, {self.max_end}'
 
-class IntervalTree:
-    def __init__(self):
-        self._tree: AVLTree = AVLTree()
-
-    def insert(self, low: int, high: int, value: Any):
-        node: IntervalNode = self._tree.search(low)
-        if node:
-            silly_duplicate_low_high_combo_bool = True      # stocks having the same low works fine because of using the high as
-            while silly_duplicate_low_high_combo_bool:      # a differentiator. But if the low AND the high are the same, this goofy
-                try:                                        # loop solves that by nudging the high up by an unnoticable amount.
-                    node.intervals_at_low.insert(high, value)
-                    silly_duplicate_low_high_combo_bool = False
-                except:
-                    high += 0.001
+class BucketNode(AVLNode):
+    __slots__ = ('count',)
+
+    def __init__(self, key: int, value: List[Any]):
+        super().__init__(key, value)
+        self.count = len(value)     # number of values in the buckets of this node's subtree
+    def copy(self) -> BucketNode:
+        clone = super().copy()
+        clone.count = self.count
+        return clone
+
+class _HighsTree(AVLTree):
+    # Highs at one low, each mapped to the bucket (list) of values sharing that exact interval. Adding a 
+    # duplicate is an append to an existing bucket; count keeps the bucket sizes summed per subtree.
+    def _new_node(self, key: int, value: List[Any]) -> BucketNode: return BucketNode(key, value)
+
+    def _update(self, node: BucketNode) -> None:
+        super()._update(node)
+        node.count = len(node.value) + (node.left.count if node.left else 0) + (node.right.count if node.right else 0)
 
+    def add(self, high: int, value: Any) -> None:
+        path = []
+        node = self._root
+        while node and high != node.key:
+            path.append(node)
+            node = node.left if high < node.key else node.right
+        if instrumentation.probe: instrumentation.probe.count(visited=len(path) + bool(node), comparisons=len(path) + bool(node))
+        if not node: return self.insert(high, [value])
+        path.append(node)
+        if self.persistent: self._copy_path(path, [high < ancestor.key for ancestor in path])
+        node = path[-1]
+        if self.persistent: node.value = node.value + [value]     # the old version still holds the old bucket
+        else: node.value.append(value)
+        if self._monoids:
+            for ancestor in reversed(path): self._update(ancestor)
         else:
-            node = IntervalNode(key=low, value=value, max_end=high, intervals_at_low=AVLTree())
-            node.intervals_at_low.insert(high, value)
-            self._tree.insert(low, node)
+            for ancestor in path: ancestor.count += 1
+        self._root = path[0]
+
+    def discard(self, high: int, value: Any) -> None:
+        path = []
+        node = self._root
+        while node and high != node.key:
+            path.append(node)
+            node = node.left if high < node.key else node.right
+        if instrumentation.probe: instrumentation.probe.count(visited=len(path) + bool(node), comparisons=len(path) + bool(node))
+        bucket = node.value if node else []
+        for i, member in enumerate(bucket):
+            if member is value: break
+        else: raise KeyError(f"{value} is not stored at high {high}.")
+        if len(bucket) == 1: return self.delete(high)
+        path.append(node)
+        if self.persistent: self._copy_path(path, [high < ancestor.key for ancestor in path])
+        node = path[-1]
+        if self.persistent: node.value = bucket[:i] + bucket[i + 1:]
+        else: del bucket[i]
+        if self._monoids:
+            for ancestor in reversed(path): self._update(ancestor)
+        else:
+            for ancestor in path: ancestor.count -= 1
+        self._root = path[0]
+
+    def count_from(self, start: int) -> int:
+        # number of values whose high is at least start
+        total = visited = 0
+        node = self._root
+        while node:
+            visited += 1
+            if node.key >= start:
+                total += len(node.value) + (node.right.count if node.right else 0)
+                node = node.left
+            else: node = node.right
+        if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+        return total
+
+    def total(self) -> int: return self._root.count if self._root else 0
+
+class _LowsTree(AVLTree):
+    def _new_node(self, key: int, value: _HighsTree) -> IntervalNode:
+        return IntervalNode(key, value, IntervalTree._max_high(value))
+
+    def _update(self, node: IntervalNode) -> None:
+        super()._update(node)
+        node.max_end = max(node.max_high, _LowsTree._max_end(node.left), _LowsTree._max_end(node.right))
+
+    @staticmethod
+    def _max_end(node: Optional[IntervalNode]) -> float: return node.max_end if node else float('-inf')
+
+# Aggregates over the lows tree for IntervalTree.range_aggregate, each measured on one lows node, i.e.
+# over every interval starting at that low. The highs trees of an aggregating IntervalTree keep their
+# summed highs (weighted by bucket size) so that sum_spread is O(1) per low as well.
+INTERVAL_AGGREGATES: Dict[str, Monoid] = {
+    'count': Monoid(lambda node: node.value.total(), operator.add, 0),
+    'min_low': Monoid(lambda node: node.key, min, float('inf')),
+    'max_high': Monoid(lambda node: node.max_high, max, float('-inf')),
+    'max_spread': Monoid(lambda node: node.max_high - node.key, max, float('-inf')),
+    'sum_spread': Monoid(lambda node: node.value._root.aggregate[0] - node.key * node.value.total(), operator.add, 0),
+}
+HIGH_SUMS: Dict[str, Monoid] = {'high_sum': Monoid(lambda node: node.key * len(node.value), operator.add, 0)}
+
+class IntervalHandle(NamedTuple):
+    low: int
+    high: int
+    value: Any
+
+SNAPSHOT_MAGIC = b'ITSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('=4sHHQQQII')
+
+# Persistent mode (IntervalTree(persistent=True) or bulk_load(..., persistent=True)) makes every write
+# copy-on-write: an insert or delete copies the O(log(n)) lows nodes, highs nodes and the one bucket it 
+# touches into a new version and publishes it with a single assignment of self._tree. Queries read 
+# self._tree once, so they always see one whole version, and snapshot() hands out a read-only view of
+# the current version that any number of threads can query without locking while the writer carries on.
+# Writers are serialized by a lock. Versions nobody references any more are simply garbage collected.
+class IntervalTree:
+    def __init__(self, persistent: bool = False, aggregates: Union[Iterable[str], Dict[str, Monoid]] = ()):
+        # aggregates: names from INTERVAL_AGGREGATES, or custom monoids over lows nodes, see range_aggregate
+        if not isinstance(aggregates, dict):
+            unknown = [name for name in aggregates if name not in INTERVAL_AGGREGATES]
+            if unknown: raise ValueError(f"Unknown aggregates {unknown}, expected some of {list(INTERVAL_AGGREGATES)}.")
+            aggregates = {name: INTERVAL_AGGREGATES[name] for name in aggregates}
+        self.persistent = persistent
+        self._aggregates = aggregates
+        self._high_sums = HIGH_SUMS if aggregates else None
+        self._tree: _LowsTree = _LowsTree(persistent=persistent, aggregates=aggregates)
+        self._write_lock = threading.Lock() if persistent else nullcontext()
+        self._index: Dict[int, IntervalHandle | List[IntervalHandle]] = {}  # id(value) -> its handle(s), for direct deletes
+        self._generation = 0                                # bumped by every insert/delete
+        self._cache: Optional[OrderedDict] = None           # query key -> (generation, result, boundary), see enable_cache
+        self._cache_maxsize = 0
+        self._ranked_keys: set = set()                      # cached top_k/bottom_k keys, patched on insert
+        self._cache_stats = dict(hits=0, misses=0, evictions=0)
+        self._cache_lock = threading.Lock()                 # readers of a persistent tree share the cache
+
+    @classmethod
+    def bulk_load(cls, rows: Iterable[Tuple[int, int, Any]], presorted: bool = False, persistent: bool = False, 
+                  aggregates: Union[Iterable[str], Dict[str, Monoid]] = ()) -> IntervalTree:
+        # Sorts the (low, high, value) rows once (stable, so equal intervals keep their input order) and
+        # builds every highs tree and the lows tree bottom-up in linear time instead of inserting row by row.
+        rows = list(rows) if presorted else sorted(rows, key=lambda row: (row[0], row[1]))
+        lows = []
+        tree = cls(persistent, aggregates)
+        for low, group in groupby(rows, key=lambda row: row[0]):
+            highs = []
+            for high, same in groupby(group, key=lambda row: row[1]):
+                highs.append((high, [value for _, _, value in same]))
+                for value in highs[-1][1]: tree._index_handle(IntervalHandle(low, high, value))
+            lows.append((low, _HighsTree.from_sorted(highs, persistent, tree._high_sums)))
+        tree._tree = _LowsTree.from_sorted(lows, persistent, tree._aggregates)
+        return tree
+
+    def insert(self, low: int, high: int, value: Any) -> IntervalHandle:
+        with self._write_lock:
+            tree = self._writable()
+            path = self._path_to(low, tree)
+            if path and path[-1].key == low:
+                node = self._own_path(path, tree)
+                node.value.add(high, value)     # an interval equal to an existing one just joins its bucket
+                node.max_high = max(node.max_high, high)
+                if self._aggregates:
+                    for ancestor in reversed(path): tree._update(ancestor)
+                else:
+                    for ancestor in path: ancestor.max_end = max(ancestor.max_end, high)   # a bigger high can only raise max_end
+
+            else:
+                highs = _HighsTree(persistent=self.persistent, aggregates=self._high_sums)
+                highs.add(high, value)
+                tree.insert(low, highs)
+            handle = self._index_handle(IntervalHandle(low, high, value))   # indexed before it is published
+            self._tree = tree
+            self._changed(low, high)
+            return handle
 
-        node.max_end = self._update_max_end(node.intervals_at_low._root)
+    def snapshot(self) -> IntervalSnapshot:
+        if not self.persistent: raise ValueError("snapshot() needs a persistent tree, see IntervalTree(persistent=True)")
+        return IntervalSnapshot(self._tree)
+
+    def _writable(self) -> _LowsTree:
+        # the tree a write should modify: in persistent mode a fresh view of the current version, which 
+        # path-copies as it changes and is published by assigning it back to self._tree
+        return self._tree.snapshot() if self.persistent else self._tree
+
+    def _own_path(self, path: List[IntervalNode], tree: _LowsTree) -> IntervalNode:
+        # Makes the nodes on path (and the last one's highs tree) safe to modify in place; in persistent 
+        # mode they are swapped for copies, rooted in tree. Returns the last node of the path.
+        if self.persistent:
+            tree._copy_path(path, [path[-1].key < node.key for node in path])
+            path[-1].value = path[-1].value.snapshot()
+            tree._root = path[0]
+        return path[-1]
+
+    def _index_handle(self, handle: IntervalHandle) -> IntervalHandle:
+        # almost every value is inserted once, so a lone handle is stored bare and only repeats get a list
+        entry = self._index.get(id(handle.value))
+        if entry is None: self._index[id(handle.value)] = handle
+        elif isinstance(entry, list): entry.append(handle)
+        else: self._index[id(handle.value)] = [entry, handle]
+        return handle
+
+    def _handles(self, value: Any) -> List[IntervalHandle]:
+        entry = self._index.get(id(value))
+        return [] if entry is None else list(entry) if isinstance(entry, list) else [entry]
     
-    def _update_max_end(self, node: AVLNode):
-        check = node
+    @staticmethod
+    def _max_high(highs: _HighsTree) -> int:
+        check = highs._root
         while check.right:
             check = check.right
         return check.key
+
+    def _path_to(self, low: int, tree: Optional[_LowsTree] = None) -> List[IntervalNode]:
+        path = []
+        node = (tree or self._tree)._root
+        while node:
+            path.append(node)
+            if low == node.key: break
+            node = node.left if low < node.key else node.right
+        if instrumentation.probe: instrumentation.probe.count(visited=len(path), comparisons=len(path))
+        return path
+
+    def _refresh(self, path: List[IntervalNode], tree: _LowsTree):
+        path[-1].max_high = IntervalTree._max_high(path[-1].value)
+        for node in reversed(path): tree._update(node)
     
     def delete(self, value: Any):
-        start: AVLTree = self._tree
-        lows = start.inorder() 
-        for low in lows:
-            node: IntervalNode = start.search(low)
-            highs_tree: AVLTree = node.intervals_at_low
-            highs = highs_tree.inorder()
-            for high in highs:
-                value_associated_with_high = highs_tree.search(high)
-                if value_associated_with_high == value:
-                    highs_tree.delete(high)
+        # Accepts either a handle returned by insert, which removes that one interval, or a value, which 
+        # removes every interval inserted with that exact object. Both are found through the index, so a 
+        # delete is a couple of O(log(n)) descents rather than a scan of every low and high.
+        with self._write_lock:
+            handles = [value] if isinstance(value, IntervalHandle) else self._handles(value)
+            if not handles or handles[0] not in self._handles(handles[0].value): 
+                raise KeyError(f"{value} is not in the interval tree.")
+            for handle in handles: self._remove(handle)
+
+    def _remove(self, handle: IntervalHandle):
+        self._unindex(handle)
+        tree = self._writable()
+        path = self._path_to(handle.low, tree)
+        if path[-1].value.total() == 1: tree.delete(handle.low)    # drop emptied lows; the delete's rebalancing repairs max_end
+        else:
+            node = self._own_path(path, tree)
+            node.value.discard(handle.high, handle.value)
+            if self._aggregates or (handle.high == node.max_high and node.value.search(handle.high) is None): self._refresh(path, tree)
+        self._tree = tree
+        self._changed()
+
+    def _unindex(self, handle: IntervalHandle) -> None:
+        handles = self._handles(handle.value)
+        handles.remove(handle)
+        if len(handles) > 1: self._index[id(handle.value)] = handles
+        elif handles: self._index[id(handle.value)] = handles[0]
+        else: del self._index[id(handle.value)]
+
+    def remove_if(self, predicate: Callable[[Any], bool]) -> int:
+        # Removes every stored value the predicate accepts, in one pass rather than a rebalancing delete 
+        # per value: each highs tree that lost values is rebuilt from its sorted survivors, untouched 
+        # ones are kept as they are, and the lows tree is rebuilt once, bottom-up, over the lows still 
+        # holding anything. O(n) overall, and every node's augmentation is recomputed by the builds. 
+        # Returns the number of values removed.
+        with self._write_lock:
+            lows: List[Tuple[int, _HighsTree]] = []
+            removed = 0
+            for low, highs_tree in self._tree.iter_inorder():
+                highs = []
+                before = removed
+                for high, bucket in highs_tree.iter_inorder():
+                    survivors = []
+                    for value in bucket:
+                        if predicate(value): self._unindex(IntervalHandle(low, high, value))
+                        else: survivors.append(value)
+                    removed += len(bucket) - len(survivors)
+                    if survivors: highs.append((high, survivors))
+                if removed == before: lows.append((low, highs_tree))
+                elif highs: lows.append((low, _HighsTree.from_sorted(highs, self.persistent, self._high_sums)))
+            if removed:
+                self._tree = _LowsTree.from_sorted(lows, self.persistent, self._aggregates)
+                self._changed()
+            return removed
+
+    def size(self) -> int:
+        # number of stored intervals, summed over the lows
+        return sum(highs.total() for _, highs in self._tree.iter_inorder())
+
+    def range_aggregate(self, lo: int, hi: int) -> Dict[str, Any]:
+        # The configured aggregates over every interval whose low is within [lo, hi], e.g. the highest 
+        # high or the widest spread in a band, in O(log(n)) without visiting the intervals themselves.
+        return self._tree.range_aggregate(lo, hi)
+
+    # Opt-in LRU cache for search/top_k/bottom_k, keyed by the query arguments (fancy included). Entries 
+    # are stamped with the generation they were computed at, so a change invalidates every entry at once
+    # just by bumping the counter; stale entries are dropped when next looked up or pushed out by the LRU.
+    # Cached top/bottom k results also remember the (low, high) of their last interval: an insert that 
+    # lands beyond that boundary cannot change a full result, so those entries are re-stamped instead.
+    # The cache's bookkeeping is guarded by a lock (queries themselves run outside it), so concurrent
+    # readers and the writer of a persistent tree can share it.
+    def enable_cache(self, maxsize: int = 256) -> None:
+        if maxsize <= 0: raise ValueError("maxsize must be positive")
+        with self._cache_lock:
+            self._cache = OrderedDict()
+            self._cache_maxsize = maxsize
+            self._ranked_keys = set()
+
+    def disable_cache(self) -> None:
+        with self._cache_lock:
+            self._cache = None
+            self._cache_maxsize = 0
+            self._ranked_keys = set()
+
+    def cache_info(self) -> Dict[str, int]:
+        return dict(self._cache_stats, size=len(self._cache) if self._cache is not None else 0, 
+                    maxsize=self._cache_maxsize, generation=self._generation)
+
+    def _cached(self, key: Tuple, compute: Callable[[], Tuple[Any, Optional[Tuple[int, int]]]]):
+        if self._cache is None: return compute()[0]
+        with self._cache_lock:
+            generation = self._generation     # read before computing, so a result is never stamped newer than its tree
+            entry = self._cache.get(key) if self._cache is not None else None
+            if entry and entry[0] == generation:
+                self._cache_stats['hits'] += 1
+                self._cache.move_to_end(key)
+                result = entry[1]
+        if not entry or entry[0] != generation:
+            result, boundary = compute()
+            with self._cache_lock:
+                self._cache_stats['misses'] += 1
+                if self._cache is not None:
+                    self._cache[key] = (generation, result, boundary)
+                    self._cache.move_to_end(key)
+                    if key[0] != 'search': self._ranked_keys.add(key)
+                    if len(self._cache) > self._cache_maxsize:
+                        evicted, _ = self._cache.popitem(last=False)
+                        self._ranked_keys.discard(evicted)
+                        self._cache_stats['evictions'] += 1
+        return list(result) if isinstance(result, list) else result
+
+    def _changed(self, low: Optional[int] = None, high: Optional[int] = None) -> None:
+        previous = self._generation
+        self._generation += 1
+        if self._cache is None or low is None: return
+        with self._cache_lock:
+            if self._cache is None: return
+            for key in list(self._ranked_keys):
+                entry = self._cache.get(key)
+                if not entry or entry[0] != previous or entry[2] is None: continue
+                # bottom k: the new interval sorts after the boundary (equal ones join the end of its bucket)
+                # top k: the new interval sorts strictly before it
+                if (low, high) >= entry[2] if key[0] == 'bottom_k' else (low, high) < entry[2]:
+                    self._cache[key] = (self._generation, entry[1], entry[2])
     
+    # Binary snapshots. Layout (native byte order, recorded in the header):
+    #   header      magic, version, flags, interval/low/high counts, symbol/name table sizes
+    #   columns     low int64, high int64, date int32 (ordinal, 0 for none), symbol uint32, name uint32 --
+    #               one entry per interval in inorder (low, high, then bucket order)
+    #   structure   distinct highs per low, bucket sizes, then the lows tree shape and each highs tree's
+    #               shape in preorder, one byte per node (bit 0: has left child, bit 1: has right child)
+    #   strings     the interned symbol and name tables, each entry a uint32 length and UTF-8 bytes
+    # Loading replays the shapes against the inorder columns, so the saved tree comes back node for node 
+    # with no sorting or rebalancing. With use_mmap the file is mapped read-only instead of being copied 
+    # into a bytes object, so workers loading the same snapshot all read the one copy in the OS page cache.
+    def save(self, path: str) -> None:
+        lows, highs, dates, symbols, names = array('q'), array('q'), array('i'), array('I'), array('I')
+        highs_per_low, bucket_sizes = array('I'), array('I')
+        lows_shape, highs_shape = bytearray(), bytearray()
+        symbol_ids: Dict[str, int] = {}
+        name_ids: Dict[str, int] = {}
+
+        IntervalTree._write_shape(self._tree._root, lows_shape)
+        for low, highs_tree in self._tree.iter_inorder():
+            highs_per_low.append(highs_tree.size())
+            IntervalTree._write_shape(highs_tree._root, highs_shape)
+            for high, bucket in highs_tree.iter_inorder():
+                bucket_sizes.append(len(bucket))
+                for stock in bucket:
+                    if not isinstance(stock, Stock): raise TypeError(f"Only Stock values can be saved, got {type(stock).__name__}.")
+                    lows.append(low)
+                    highs.append(high)
+                    dates.append(stock.date.toordinal() if stock.date else 0)
+                    symbols.append(symbol_ids.setdefault(stock.symbol, len(symbol_ids)))
+                    names.append(name_ids.setdefault(stock.name, len(name_ids)))
+
+        with open(path, 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'big', len(lows), 
+                                                len(highs_per_low), len(bucket_sizes), len(symbol_ids), len(name_ids)))
+            for section in (lows, highs, dates, symbols, names, highs_per_low, bucket_sizes, lows_shape, highs_shape):
+                snapshot.write(section)
+            for table in (symbol_ids, name_ids):
+                for string in table:
+                    encoded = string.encode('utf-8')
+                    snapshot.write(struct.pack('I', len(encoded)) + encoded)
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> IntervalTree:
+        with open(path, 'rb') as snapshot:
+            buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else snapshot.read()
+        view = memoryview(buffer)
+        try: return cls._from_snapshot(view)
+        finally:
+            view.release()
+            if use_mmap: buffer.close()
+
+    @classmethod
+    def _from_snapshot(cls, view: memoryview) -> IntervalTree:
+        def _column(code: str, count: int) -> memoryview:
+            nonlocal offset
+            width = struct.calcsize(code)
+            column = view[offset:offset + width * count].cast(code)
+            offset += width * count
+            columns.append(column)
+            return column
+
+        def _strings(count: int) -> List[str]:
+            nonlocal offset
+            strings = []
+            for _ in range(count):
+                (length,) = struct.unpack_from('I', view, offset)
+                strings.append(str(view[offset + 4:offset + 4 + length], 'utf-8'))
+                offset += 4 + length
+            return strings
+
+        def _read_shape(shape: Iterator[int], make: Callable[[], AVLNode], tree: AVLTree) -> AVLNode:
+            # rebuilds one preorder-encoded shape; make() creates the next node in inorder
+            flags = next(shape)
+            left = _read_shape(shape, make, tree) if flags & 1 else None
+            node = make()
+            node.left = left
+            node.right = _read_shape(shape, make, tree) if flags & 2 else None
+            tree._update(node)
+            return node
+
+        def _make_high() -> BucketNode:
+            nonlocal row, high_at
+            first, row = row, row + bucket_sizes[high_at]
+            high_at += 1
+            bucket = []
+            for at in range(first, row):
+                if dates[at] not in date_table: date_table[dates[at]] = datetime.date.fromordinal(dates[at])
+                stock = Stock(symbol_table[symbols[at]], name_table[names[at]], lows[at], highs[at], date_table[dates[at]])
+                bucket.append(stock)
+                tree._index_handle(IntervalHandle(lows[at], highs[at], stock))
+            return highs_tree._new_node(highs[first], bucket)
+
+        def _make_low() -> IntervalNode:
+            nonlocal low_at, highs_tree
+            first = row
+            highs_tree = _HighsTree()
+            highs_tree._root = _read_shape(highs_shapes, _make_high, highs_tree)
+            highs_tree._size = highs_per_low[low_at]
+            low_at += 1
+            return tree._tree._new_node(lows[first], highs_tree)
+
+        magic, version, big_endian, count, low_count, high_count, symbol_count, name_count = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC: raise ValueError("Not an interval tree snapshot.")
+        if version != SNAPSHOT_VERSION: raise ValueError(f"Unsupported snapshot version {version}.")
+        if big_endian != (sys.byteorder == 'big'): raise ValueError("Snapshot was written with a different byte order.")
+        offset = SNAPSHOT_HEADER.size
+        columns: List[memoryview] = []
+        try:
+            lows, highs, dates = _column('q', count), _column('q', count), _column('i', count)
+            symbols, names = _column('I', count), _column('I', count)
+            highs_per_low, bucket_sizes = _column('I', low_count), _column('I', high_count)
+            lows_shape, highs_shape = _column('B', low_count), _column('B', high_count)
+            symbol_table, name_table = _strings(symbol_count), _strings(name_count)
+            date_table: Dict[int, Optional[datetime.date]] = {0: None}      # dates repeat a lot, so share one object per day
+
+            tree = cls()
+            highs_shapes = iter(highs_shape)
+            row = low_at = high_at = 0
+            highs_tree: Optional[_HighsTree] = None
+            if low_count: tree._tree._root = _read_shape(iter(lows_shape), _make_low, tree._tree)
+            tree._tree._size = low_count
+            return tree
+        finally:
+            for column in columns: column.release()
+
+    @staticmethod
+    def _write_shape(node: Optional[AVLNode], shape: bytearray) -> None:
+        if not node: return
+        shape.append(bool(node.left) | bool(node.right) << 1)
+        IntervalTree._write_shape(node.left, shape)
+        IntervalTree._write_shape(node.right, shape)
+
+    def memory_report(self) -> Dict[str, float]:
+        # Shallow sizes of everything the tree itself allocates (nodes, the nested highs trees, buckets and
+        # the delete index); the stored values are reported separately since they belong to the caller.
+        report = dict(intervals=0, lows=0, node_bytes=0, highs_tree_bytes=0, bucket_bytes=0, index_bytes=0, value_bytes=0)
+        for low_node in self._iter_nodes(self._tree._root):
+            highs: _HighsTree = low_node.value
+            report['lows'] += 1
+            report['node_bytes'] += sys.getsizeof(low_node)
+            report['highs_tree_bytes'] += sys.getsizeof(highs) + sys.getsizeof(highs.__dict__)
+            for high_node in self._iter_nodes(highs._root):
+                report['intervals'] += len(high_node.value)
+                report['node_bytes'] += sys.getsizeof(high_node)
+                report['bucket_bytes'] += sys.getsizeof(high_node.value)
+                report['value_bytes'] += sum(map(sys.getsizeof, high_node.value))
+        report['index_bytes'] = sys.getsizeof(self._index) + sum(sys.getsizeof(entry) + (sum(map(sys.getsizeof, entry)) if isinstance(entry, list) else 0) for entry in self._index.values())
+        total = report['node_bytes'] + report['highs_tree_bytes'] + report['bucket_bytes'] + report['index_bytes']
+        report['total_bytes'] = total
+        report['bytes_per_interval'] = total / report['intervals'] if report['intervals'] else 0.0
+        return report
+
+    @staticmethod
+    def _iter_nodes(root: Optional[AVLNode]) -> Iterator[AVLNode]:
+        stack = [root] if root else []
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.left: stack.append(node.left)
+            if node.right: stack.append(node.right)
+
     def search(self, start: int, end: int | None = None, fancy: bool = False):
+        return self._cached(('search', start, end, fancy), lambda: (self._search(start, end, fancy), None))
+
+    def _search(self, start: int, end: int | None, fancy: bool):
         intervals = self._search_range(start, end) if end else self._search_point(start)
         if fancy:
             if end: string = f"Range query for stocks with low-high intervals overlapping with [${start}, ${end}]:"
@@ -84,65 +573,147 @@ class IntervalTree:
         return intervals
     
     def _search_point(self, value: int):
-        intervals = []
-        valid_lows = [self._tree.search(low) for low in self._tree.inorder() if self._tree.search(low).key <= value and value <= self._tree.search(low).max_end] # only search through nodes whos low is <= the Value and max_end is >= the Value, cutting off unnecessary searches on both sides.
-        for node in valid_lows:
-            node: IntervalNode
-            for high in node.intervals_at_low.inorder():
-                if value <= high:
-                    intervals.append(node.intervals_at_low.search(high))
-        return intervals
+        return self._search_overlapping(value, value)
     
     def _search_range(self, start: int, end: int):
+        return self._search_overlapping(start, end)
+
+    def _search_overlapping(self, start: int, end: int):
+        def _search_highs(node: Optional[AVLNode]):
+            nonlocal visited
+            if not node: return
+            visited += 1
+            if node.key >= start:
+                _search_highs(node.left)
+                intervals.extend(node.value)
+            _search_highs(node.right)
+
         intervals = []
-        valid_lows = [self._tree.search(low) for low in self._tree.inorder() if self._tree.search(low).key <= end and start <= self._tree.search(low).max_end] # only search through nodes whos low is <= the Value and max_end is >= the Value
-        for node in valid_lows:
-            node: IntervalNode
-            for high in node.intervals_at_low.inorder():
-                intervals.append(node.intervals_at_low.search(high))
+        visited = 0
+        for low_node in self._overlapping_lows(start, end): _search_highs(low_node.value._root)
+        if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
         return intervals
 
-    def bottom_k(self, k: int, fancy: bool = False):
-        intervals = []
-        lows = self._tree.inorder()
-        for low in lows:
-            low_node: IntervalNode = self._tree.search(low)
-            highs_tree = low_node.intervals_at_low
-            for high in highs_tree.inorder():
-                high_node = highs_tree.search(high)
-                if len(intervals) < k: intervals.append(high_node)
-                else: break
-            else: continue
-            break
+    def count(self, point: int) -> int:
+        return self.count_overlaps(point, point)
 
-        if fancy:
-            string = f"Bottom {len(intervals)} Queries:"
-            for i in intervals:
-                string += f"\n{i}"
-            return string
-        return intervals
+    def count_overlaps(self, start: int, end: int) -> int:
+        # same pruned walk as the searches, but each low contributes the number of its values with a high
+        # >= start straight from the highs tree's subtree counts, so nothing is collected
+        return sum(low_node.value.count_from(start) for low_node in self._overlapping_lows(start, end))
+
+    # Batched stabbing queries. The distinct points are sorted once and the lows tree is walked a single 
+    # time, carrying the slice of points that can still match inside each subtree: points above a 
+    # subtree's max_end are dropped before entering it, and points below a node's low are dropped before
+    # its right subtree, since they cannot match that low or anything after it. Every node is therefore 
+    # visited at most once for the whole batch, and each point still gets its intervals in search() order.
+    def search_many(self, points: Iterable[int]) -> List[List[Any]]:
+        def _collect(highs: _HighsTree, first: int, last: int):
+            for high, bucket in highs.iter_inorder(unique[first]):
+                for i in range(first, bisect_right(unique, high, first, last)): results[i].extend(bucket)
+
+        points = list(points)
+        unique = sorted(set(points))
+        results: List[List[Any]] = [[] for _ in unique]
+        self._sweep(unique, _collect)
+        position = {point: i for i, point in enumerate(unique)}
+        return [list(results[position[point]]) for point in points]
+
+    def count_many(self, points: Iterable[int]) -> List[int]:
+        def _count(highs: _HighsTree, first: int, last: int):
+            for i in range(first, last): counts[i] += highs.count_from(unique[i])
+
+        points = list(points)
+        unique = sorted(set(points))
+        counts = [0] * len(unique)
+        self._sweep(unique, _count)
+        position = {point: i for i, point in enumerate(unique)}
+        return [counts[position[point]] for point in points]
+
+    def _sweep(self, points: List[int], visit: Callable[[_HighsTree, int, int], None]):
+        def _sweep_lows(node: Optional[IntervalNode], first: int, last: int):
+            nonlocal visited
+            if not node: return
+            visited += 1
+            last = bisect_right(points, node.max_end, first, last)     # points past max_end match nothing in here
+            if first >= last: return
+            _sweep_lows(node.left, first, last)
+            first = bisect_left(points, node.key, first, last)         # points below this low are done
+            if first >= last: return
+            visit(node.value, first, last)
+            _sweep_lows(node.right, first, last)
+
+        visited = 0
+        _sweep_lows(self._tree._root, 0, len(points))
+        if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+
+    def _overlapping_lows(self, start: int, end: int) -> Iterator[IntervalNode]:
+        # In-order walk over the lows that can hold an interval overlapping [start, end]: subtrees whose 
+        # max_end is below start are never entered, and the walk ends at the first low past end.
+        stack: List[IntervalNode] = []
+        node = self._tree._root
+        visited = 0
+        try:
+            while True:
+                while node and node.max_end >= start:
+                    visited += 1
+                    stack.append(node)
+                    node = node.left
+                if not stack: return
+                node = stack.pop()
+                if node.key > end: return
+                yield node
+                node = node.right
+        finally:
+            if instrumentation.probe: instrumentation.probe.count(visited=visited, comparisons=visited)
+
+    def _iter_intervals(self, reverse: bool = False) -> Iterator[Any]:
+        with closing(self._iter_entries(reverse)) as entries:
+            for _, _, value in entries: yield value
+
+    def _iter_entries(self, reverse: bool = False) -> Iterator[Tuple[int, int, Any]]:
+        # the tree iterators are closed as soon as this one is, so under a probe the nodes they walked
+        # are counted by the operation that stopped early (top_k after k) rather than left to the collector
+        with closing(self._tree.iter_reversed() if reverse else self._tree.iter_inorder()) as lows:
+            for low, highs in lows:
+                with closing(highs.iter_reversed() if reverse else highs.iter_inorder()) as entries:
+                    for high, bucket in entries:
+                        for value in (reversed(bucket) if reverse else bucket): yield low, high, value
+
+    def bottom_k(self, k: int, fancy: bool = False):
+        return self._cached(('bottom_k', k, fancy), lambda: self._ranked(k, fancy, reverse=False))
     
     def top_k(self, k: int, fancy: bool = False):
-        intervals = []
-        lows = self._tree.inorder()
-        lows.reverse()
-        for low in lows:
-            low_node: IntervalNode = self._tree.search(low)
-            highs_tree = low_node.intervals_at_low
-            highs = highs_tree.inorder()
-            highs.reverse()
-            for high in highs:
-                high_node = highs_tree.search(high)
-                if len(intervals) < k: intervals.append(high_node)
-                else: break
-            else: continue
-            break
-        
+        return self._cached(('top_k', k, fancy), lambda: self._ranked(k, fancy, reverse=True))
+
+    def _ranked(self, k: int, fancy: bool, reverse: bool) -> Tuple[Any, Optional[Tuple[int, int]]]:
+        with closing(self._iter_entries(reverse)) as walk: entries = list(islice(walk, max(k, 0)))
+        boundary = entries[-1][:2] if entries and len(entries) == k else None   # only a full result can survive inserts
+        intervals = [value for _, _, value in entries]
+
         if fancy:
-            string = f"Top {len(intervals)} Queries:"
+            string = f"{'Top' if reverse else 'Bottom'} {len(intervals)} Queries:"
             for i in intervals:
                 string += f"\n{i}"
-            return string
-        return intervals
-        
+            return string, boundary
+        return intervals, boundary
+
+instrumentation.register(IntervalTree, 'insert', 'delete', 'search', 'search_many', 'top_k', 'bottom_k', 'range_aggregate')
+instrumentation.register(IntervalTree, 'remove_if', returns_count=True)    # writes too, but it returns how many it removed
+instrumentation.register(IntervalTree, 'count', 'count_overlaps', 'count_many', returns_count=True)
+
+class IntervalSnapshot(IntervalTree):
+    # One immutable version of a persistent IntervalTree, from IntervalTree.snapshot(). It answers every
+    # query without locking; it has no delete index or cache, and writing to it is an error.
+    def __init__(self, tree: _LowsTree):
+        super().__init__()
+        self._tree = tree
+
+    def insert(self, low: int, high: int, value: Any) -> IntervalHandle:
+        raise TypeError("Interval tree snapshots are read-only.")
+
+    def delete(self, value: Any):
+        raise TypeError("Interval tree snapshots are read-only.")
 
+    def remove_if(self, predicate: Callable[[Any], bool]) -> int:
+        raise TypeError("Interval tree snapshots are read-only.")
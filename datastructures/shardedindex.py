@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import heapq
+import os
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from datastructures.ingest import IngestStats, Source, read_stocks
+from datastructures.intervaltree import IntervalTree
+from datastructures.stock import Stock
+
+
+# An interval index partitioned by Stock.symbol: one IntervalTree per symbol, or per hash bucket of
+# symbols when there are too many symbols for a tree each. Shards live in worker processes, one
+# single-process pool per worker so a worker keeps its shards in memory between calls. Every worker
+# reads the CSV sources itself, skips the rows of symbols it does not own before parsing them, and
+# bulk loads its own shards, so the builds run in parallel with nothing pickled across processes.
+#
+# A query for one symbol goes to the single worker that owns it and touches only that symbol's shard.
+# A query across all symbols fans out to every worker, each merging its own shards first, and the
+# sorted partial results are merged again here (a k-way merge for top_k/bottom_k, which only ever
+# needs k intervals from each worker). Symbols are placed with crc32, which, unlike hash(), is the
+# same in every process.
+#
+# Results are ordered by (low, high) like IntervalTree's, but equal intervals from different shards
+# may come out in a different order than a single tree would give them.
+#
+#   with ShardedIntervalIndex('synthetic_stock_data.csv', workers=4) as index:
+#       index.search(155, symbol='AAPL')
+#       index.top_k(10)
+
+def _crc(symbol: str) -> int: return zlib.crc32(symbol.encode('utf-8'))
+
+def _interval(stock: Stock): return stock.low, stock.high
+
+def _fancy(title: str, intervals: List[Stock]) -> str:
+    string = title
+    for i in intervals:
+        string += f"\n{i}"
+    return string
+
+# Shard-side work. In a worker process the shards are the module global below, filled in by the pool
+# initializer; with workers=0 the index calls the same functions on its own shards.
+_shards: Dict[Any, IntervalTree] = {}
+_stats: Optional[IngestStats] = None
+
+def _build_shards(sources: List[Source], worker: int, workers: int, buckets: Optional[int], chunk_size: int,
+                  stats: IngestStats) -> Dict[Any, IntervalTree]:
+    rows: Dict[Any, list] = {}
+    mine = (lambda symbol: _crc(symbol) % workers == worker) if workers > 1 else None
+    for chunk in read_stocks(sources, chunk_size, stats, select=mine):
+        for stock in chunk:
+            shard = stock.symbol if buckets is None else _crc(stock.symbol) % buckets
+            rows.setdefault(shard, []).append((stock.low, stock.high, stock))
+    return {shard: IntervalTree.bulk_load(shard_rows) for shard, shard_rows in rows.items()}
+
+def _init_worker(sources: List[Source], worker: int, workers: int, buckets: Optional[int], chunk_size: int) -> None:
+    global _shards, _stats
+    _stats = IngestStats()
+    started = time.perf_counter()
+    _shards = _build_shards(sources, worker, workers, buckets, chunk_size, _stats)
+    _stats.seconds = time.perf_counter() - started
+
+def _worker_stats() -> IngestStats: return _stats
+
+def _targets(shards: Dict[Any, IntervalTree], symbol: Optional[str], buckets: Optional[int]) -> List[IntervalTree]:
+    if symbol is None: return list(shards.values())
+    shard = shards.get(symbol if buckets is None else _crc(symbol) % buckets)
+    return [shard] if shard else []
+
+def _shard_search(start: int, end: Optional[int], symbol: Optional[str], buckets: Optional[int],
+                  shards: Optional[Dict[Any, IntervalTree]] = None) -> List[Stock]:
+    found = [tree.search(start, end) for tree in _targets(_shards if shards is None else shards, symbol, buckets)]
+    if symbol is not None and buckets is not None: found = [[v for v in found[0] if v.symbol == symbol]] if found else []
+    return found[0] if len(found) == 1 else list(heapq.merge(*found, key=_interval))
+
+def _shard_count(start: int, end: int, symbol: Optional[str], buckets: Optional[int],
+                 shards: Optional[Dict[Any, IntervalTree]] = None) -> int:
+    if symbol is not None and buckets is not None: return len(_shard_search(start, end, symbol, buckets, shards))
+    return sum(tree.count_overlaps(start, end) for tree in _targets(_shards if shards is None else shards, symbol, buckets))
+
+def _shard_ranked(k: int, reverse: bool, symbol: Optional[str], buckets: Optional[int],
+                  shards: Optional[Dict[Any, IntervalTree]] = None) -> List[Stock]:
+    trees = _targets(_shards if shards is None else shards, symbol, buckets)
+    if symbol is not None and buckets is not None:
+        return list(islice((v for v in trees[0]._iter_intervals(reverse) if v.symbol == symbol), max(k, 0))) if trees else []
+    ranked = [tree.top_k(k) if reverse else tree.bottom_k(k) for tree in trees]
+    return list(islice(heapq.merge(*ranked, key=_interval, reverse=reverse), max(k, 0)))
+
+class ShardedIntervalIndex:
+    def __init__(self, sources: Union[Source, Iterable[Source]], workers: Optional[int] = None,
+                 buckets: Optional[int] = None, chunk_size: int = 65536, stats: Optional[IngestStats] = None):
+        # workers=None uses one worker per CPU; workers=0 keeps the shards in this process instead
+        if buckets is not None and buckets <= 0: raise ValueError("buckets must be positive")
+        sources = [sources] if isinstance(sources, (str, os.PathLike)) else list(sources)
+        self.buckets = buckets
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.stats = stats if stats is not None else IngestStats()
+        self._pools: List[ProcessPoolExecutor] = []
+        self._local: Optional[Dict[Any, IntervalTree]] = None
+        started = time.perf_counter()
+
+        if not self.workers:
+            self._local = _build_shards(sources, 0, 1, buckets, chunk_size, self.stats)
+        else:
+            self._pools = [ProcessPoolExecutor(1, initializer=_init_worker, initargs=(sources, worker, self.workers, buckets, chunk_size))
+                           for worker in range(self.workers)]
+            try: worker_stats = self._gather(pool.submit(_worker_stats) for pool in self._pools)   # starts every build at once
+            except BaseException:
+                self.close()
+                raise
+            # every worker reads all of the input, so bytes are counted once
+            self.stats.rows += sum(stats.rows for stats in worker_stats)
+            self.stats.bytes += max(stats.bytes for stats in worker_stats)
+            self.stats.malformed.extend(sorted((row for stats in worker_stats for row in stats.malformed), key=lambda row: (row.source, row.line)))
+        self.stats.seconds = time.perf_counter() - started
+
+    def close(self) -> None:
+        for pool in self._pools: pool.shutdown(cancel_futures=True)
+        self._pools = []
+
+    def __enter__(self) -> ShardedIntervalIndex: return self
+
+    def __exit__(self, *exc_info) -> None: self.close()
+
+    @staticmethod
+    def _gather(futures: Iterable[Future]) -> List[Any]:
+        return [future.result() for future in list(futures)]
+
+    def _call(self, function, *args, symbol: Optional[str] = None) -> List[Any]:
+        # runs function on the shards that can hold symbol (all of them for None), one result per worker
+        args = (*args, symbol, self.buckets)
+        if self._local is not None: return [function(*args, self._local)]
+        if not self._pools: raise ValueError("The sharded index has been closed.")
+        if symbol is not None: return [self._pools[_crc(symbol) % self.workers].submit(function, *args).result()]
+        return self._gather(pool.submit(function, *args) for pool in self._pools)
+
+    def search(self, start: int, end: int | None = None, symbol: Optional[str] = None, fancy: bool = False):
+        results = self._call(_shard_search, start, end, symbol=symbol)
+        intervals = results[0] if len(results) == 1 else list(heapq.merge(*results, key=_interval))
+        if fancy:
+            if end: return _fancy(f"Range query for stocks with low-high intervals overlapping with [${start}, ${end}]:", intervals)
+            return _fancy(f"Search query for stocks containing price point ${start}:", intervals)
+        return intervals
+
+    def count(self, point: int, symbol: Optional[str] = None) -> int:
+        return self.count_overlaps(point, point, symbol)
+
+    def count_overlaps(self, start: int, end: int, symbol: Optional[str] = None) -> int:
+        return sum(self._call(_shard_count, start, end, symbol=symbol))
+
+    def bottom_k(self, k: int, symbol: Optional[str] = None, fancy: bool = False):
+        intervals = self._ranked(k, False, symbol)
+        return _fancy(f"Bottom {len(intervals)} Queries:", intervals) if fancy else intervals
+
+    def top_k(self, k: int, symbol: Optional[str] = None, fancy: bool = False):
+        intervals = self._ranked(k, True, symbol)
+        return _fancy(f"Top {len(intervals)} Queries:", intervals) if fancy else intervals
+
+    def _ranked(self, k: int, reverse: bool, symbol: Optional[str]) -> List[Stock]:
+        results = self._call(_shard_ranked, k, reverse, symbol=symbol)
+        return results[0] if len(results) == 1 else list(islice(heapq.merge(*results, key=_interval, reverse=reverse), max(k, 0)))
+
+    def size(self) -> int: return self.stats.rows
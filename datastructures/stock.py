@@ -1,11 +1,14 @@
-from __future__ import annotations
-from dataclasses import dataclass
-
-@dataclass
-class Stock:
-    symbol: str
-    name: str
-    low: int
-    high: int
-    def __repr__(self):
-        return f'Symbol: {self.symbol}, Name: {self.name}, Low: {self.low}, High: {self.high}'
\ No newline at end of file
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+@dataclass
+class Stock:
+    symbol: str
+    name: str
+    low: int
+    high: int
+    date: Optional[date] = None
+    def __repr__(self):
+        return f'Symbol: {self.symbol}, Name: {self.name}, Low: {self.low}, High: {self.high}'
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from datastructures.intervaltree import IntervalHandle, IntervalTree
+from datastructures.stock import Stock
+
+
+# Price queries limited to a date window. Stocks are split by date into fixed-width buckets of
+# bucket_days days, each with its own IntervalTree, and the bucket numbers are kept sorted so a
+# window [since, until] maps to a contiguous run of buckets with two bisects. Buckets that lie wholly
+# inside the window answer straight from their tree (counts without collecting anything); only the
+# two edge buckets, which can straddle since or until, have their matches filtered by date. A query
+# therefore costs O(log(n)) per bucket in the window plus the matches, never a scan of the history
+# outside it. Results from the buckets are merged back into (low, high) order.
+#
+# Stocks without a date live in a separate tree and are only included by queries with no window.
+#
+# Retention: expire_before(day) drops every bucket that ends before day outright and clears the one 
+# bucket straddling it with a single IntervalTree.remove_if rebuild, so expiring old data costs one 
+# pass over at most one bucket rather than a delete per row. With retain_days set, the index keeps 
+# only the last retain_days days (counted back from the newest date it has seen) and expires older 
+# buckets by itself as newer dates arrive, so a long-running process holds a constant-size window.
+#
+#   index = TimeIntervalIndex.from_stocks(stocks, bucket_days=7)
+#   index.search(155, since=date(2024, 3, 1), until=date(2024, 3, 31))
+
+def _interval(stock: Stock): return stock.low, stock.high
+
+class TimeIntervalIndex:
+    def __init__(self, bucket_days: int = 7, retain_days: Optional[int] = None):
+        if bucket_days <= 0: raise ValueError("bucket_days must be positive")
+        if retain_days is not None and retain_days <= 0: raise ValueError("retain_days must be positive")
+        self.bucket_days = bucket_days
+        self.retain_days = retain_days
+        self._cutoff: Optional[date] = None     # with retain_days, everything dated before this is gone
+        self._buckets: Dict[int, IntervalTree] = {}     # bucket number (date ordinal // bucket_days) -> its tree
+        self._keys: List[int] = []                      # the bucket numbers in order
+        self._undated = IntervalTree()
+        self._size = 0
+
+    @classmethod
+    def from_stocks(cls, stocks: Iterable[Stock], bucket_days: int = 7, retain_days: Optional[int] = None) -> TimeIntervalIndex:
+        index = cls(bucket_days, retain_days)
+        rows: Dict[Optional[int], list] = {}
+        for stock in stocks: rows.setdefault(index._bucket_of(stock.date), []).append((stock.low, stock.high, stock))
+        for bucket, bucket_rows in rows.items():
+            tree = IntervalTree.bulk_load(bucket_rows)
+            if bucket is None: index._undated = tree
+            else: index._buckets[bucket] = tree
+            index._size += len(bucket_rows)
+        index._keys = sorted(index._buckets)
+        if index._keys: index._retain(max(stock.date for _, _, stock in rows[index._keys[-1]]))
+        return index
+
+    def _bucket_of(self, day: Optional[date]) -> Optional[int]:
+        return None if day is None else day.toordinal() // self.bucket_days
+
+    def insert(self, stock: Stock) -> Optional[IntervalHandle]:
+        # with retain_days, a stock already older than the window is not stored and None is returned
+        if self._cutoff and stock.date and stock.date < self._cutoff: return None
+        bucket = self._bucket_of(stock.date)
+        if bucket is None: tree = self._undated
+        elif bucket in self._buckets: tree = self._buckets[bucket]
+        else:
+            tree = self._buckets[bucket] = IntervalTree()
+            insort(self._keys, bucket)
+        handle = tree.insert(stock.low, stock.high, stock)
+        self._size += 1
+        if bucket is not None: self._retain(stock.date)
+        return handle
+
+    def delete(self, stock: Stock) -> None:
+        bucket = self._bucket_of(stock.date)
+        tree = self._undated if bucket is None else self._buckets.get(bucket)
+        if tree is None: raise KeyError(f"{stock} is not in the time index.")
+        removed = len(tree._handles(stock))
+        tree.delete(stock)
+        self._size -= removed
+        if bucket is not None and not tree._tree._root: self._drop(bucket)     # emptied buckets don't linger
+
+    def _drop(self, bucket: int) -> None:
+        del self._buckets[bucket]
+        del self._keys[bisect_left(self._keys, bucket)]
+
+    def size(self) -> int: return self._size
+
+    def expire_before(self, day: date) -> int:
+        # removes every dated stock older than day; returns how many were removed
+        cutoff = self._bucket_of(day)
+        expired = bisect_left(self._keys, cutoff)
+        removed = sum(self._buckets.pop(bucket).size() for bucket in self._keys[:expired])
+        del self._keys[:expired]
+        if self._keys and self._keys[0] == cutoff:
+            tree = self._buckets[cutoff]
+            removed += tree.remove_if(lambda stock: stock.date < day)
+            if not tree._tree._root: self._drop(cutoff)
+        self._size -= removed
+        return removed
+
+    def _retain(self, latest: date) -> None:
+        # moves the retention cutoff up to latest's window, expiring only when the cutoff actually advances
+        if self.retain_days is None: return
+        cutoff = latest - timedelta(days=self.retain_days - 1)
+        if self._cutoff is None or cutoff > self._cutoff:
+            self._cutoff = cutoff
+            self.expire_before(cutoff)
+
+    def _covering(self, since: Optional[date], until: Optional[date]) -> Iterator[Tuple[IntervalTree, bool]]:
+        # The trees that can hold stocks dated within [since, until], each with whether it also holds
+        # dates outside the window (and so needs its matches filtered).
+        if since is None and until is None: yield self._undated, False
+        first = 0 if since is None else bisect_left(self._keys, self._bucket_of(since))
+        last = len(self._keys) if until is None else bisect_right(self._keys, self._bucket_of(until))
+        for bucket in self._keys[first:last]:
+            first_day = bucket * self.bucket_days
+            straddles = (since is not None and since.toordinal() > first_day) or \
+                        (until is not None and until.toordinal() < first_day + self.bucket_days - 1)
+            yield self._buckets[bucket], straddles
+
+    @staticmethod
+    def _within(stock: Stock, since: Optional[date], until: Optional[date]) -> bool:
+        return (since is None or since <= stock.date) and (until is None or stock.date <= until)
+
+    def search(self, start: int, end: int | None = None, since: Optional[date] = None, until: Optional[date] = None,
+               fancy: bool = False):
+        found = []
+        for tree, straddles in self._covering(since, until):
+            intervals = tree.search(start, end)
+            found.append([v for v in intervals if self._within(v, since, until)] if straddles else intervals)
+        intervals = found[0] if len(found) == 1 else list(heapq.merge(*found, key=_interval))
+        if fancy:
+            window = f" between {since or 'the start'} and {until or 'now'}" if since or until else ""
+            if end: string = f"Range query for stocks with low-high intervals overlapping with [${start}, ${end}]{window}:"
+            else: string = f"Search query for stocks containing price point ${start}{window}:"
+            for i in intervals:
+                string += f"\n{i}"
+            return string
+        return intervals
+
+    def count(self, point: int, since: Optional[date] = None, until: Optional[date] = None) -> int:
+        return self.count_overlaps(point, point, since, until)
+
+    def count_overlaps(self, start: int, end: int, since: Optional[date] = None, until: Optional[date] = None) -> int:
+        return sum(sum(1 for v in tree.search(start, end) if self._within(v, since, until)) if straddles
+                   else tree.count_overlaps(start, end) for tree, straddles in self._covering(since, until))
+
+    def bottom_k(self, k: int, since: Optional[date] = None, until: Optional[date] = None, fancy: bool = False):
+        intervals = self._ranked(k, False, since, until)
+        if fancy:
+            string = f"Bottom {len(intervals)} Queries:"
+            for i in intervals:
+                string += f"\n{i}"
+            return string
+        return intervals
+
+    def top_k(self, k: int, since: Optional[date] = None, until: Optional[date] = None, fancy: bool = False):
+        intervals = self._ranked(k, True, since, until)
+        if fancy:
+            string = f"Top {len(intervals)} Queries:"
+            for i in intervals:
+                string += f"\n{i}"
+            return string
+        return intervals
+
+    def _ranked(self, k: int, reverse: bool, since: Optional[date], until: Optional[date]) -> List[Stock]:
+        # each bucket streams its intervals lazily, so the merge stops after k
+        streams = [(v for v in tree._iter_intervals(reverse) if self._within(v, since, until)) if straddles
+                   else tree._iter_intervals(reverse) for tree, straddles in self._covering(since, until)]
+        return list(islice(heapq.merge(*streams, key=_interval, reverse=reverse), max(k, 0)))
@@ -0,0 +1,149 @@
+from datastructures.ingest import load_interval_tree
+from server import QueryServer
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+# Load generator for server.py. Opens a number of connections, keeps a fixed number of requests in
+# flight on each, and times every request from sending it to receiving its last line. The request mix
+# is weighted per op; points and ranges are drawn from a seeded generator like benchmark.py's. The
+# report gives overall throughput and, per op, p50/p99/max latency, along with the server's own
+# batching counters.
+#
+#   python server.py &
+#   python loadgen.py --connections 8 --concurrency 16 --requests 20000
+#
+# --serve CSV starts a server in this process on a free port first, which keeps the whole test on
+# localhost in one command (client and server then share one event loop).
+
+class Client:
+    # Pipelined client: any number of requests can be outstanding on the one connection, matched to
+    # their responses by id.
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader, self._writer = reader, writer
+        self._ids = itertools.count(1)
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._partial: Dict[int, List[Dict]] = {}
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: int = 8351, unix: Optional[str] = None) -> 'Client':
+        reader, writer = await (asyncio.open_unix_connection(unix) if unix else asyncio.open_connection(host, port))
+        return cls(reader, writer)
+
+    async def request(self, op: str, **arguments: Any) -> Any:
+        # returns the list of stock dicts, the count, or the stats, depending on op
+        request_id = next(self._ids)
+        future = self._waiting[request_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(json.dumps(dict(arguments, id=request_id, op=op)).encode('utf-8') + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def _receive(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                request_id = response.get('id')
+                if 'results' in response:
+                    self._partial.setdefault(request_id, []).extend(response['results'])
+                    if response['more']: continue
+                    result = self._partial.pop(request_id)
+                else: result = response.get('count', response.get('stats'))
+                future = self._waiting.pop(request_id, None)
+                if not future or future.done(): continue
+                if 'error' in response: future.set_exception(RuntimeError(response['error']))
+                else: future.set_result(result)
+        finally:
+            for future in self._waiting.values():
+                if not future.done(): future.set_exception(ConnectionError("connection closed"))
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._receiver.cancel()
+
+def _percentile(ordered: Sequence[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def _make_request(rng: random.Random, op: str, k: int) -> Dict[str, Any]:
+    point = rng.randint(40, 700)
+    if op in ('search', 'count'): return dict(op=op, point=point)
+    if op == 'range': return dict(op=op, start=point, end=point + rng.randint(1, 50))
+    return dict(op=op, k=k)
+
+async def run_load(connect, connections: int, concurrency: int, requests: int, mix: Dict[str, float],
+                   k: int = 10, seed: int = 351) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    ops, weights = list(mix), list(mix.values())
+    plan = [_make_request(rng, op, k) for op in rng.choices(ops, weights, k=requests)]
+    queue = iter(plan)      # shared by every sender; each takes the next request when it is free
+    latencies: Dict[str, List[float]] = {op: [] for op in ops}
+    errors = 0
+
+    async def _sender(client: Client) -> None:
+        nonlocal errors
+        for request in queue:
+            started = time.perf_counter_ns()
+            try: await client.request(**request)
+            except RuntimeError: errors += 1
+            latencies[request['op']].append(time.perf_counter_ns() - started)
+
+    clients = [await connect() for _ in range(connections)]
+    started = time.perf_counter()
+    await asyncio.gather(*(_sender(client) for client in clients for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    server_stats = await clients[0].request('stats')
+    for client in clients: await client.close()
+
+    report = dict(requests=requests, errors=errors, seconds=seconds, requests_per_sec=requests / seconds if seconds else 0.0,
+                  connections=connections, concurrency=concurrency, server=server_stats, ops={})
+    for op, times in latencies.items():
+        times.sort()
+        report['ops'][op] = dict(count=len(times), p50_ms=_percentile(times, 0.50) / 1e6,
+                                 p99_ms=_percentile(times, 0.99) / 1e6, max_ms=(times[-1] if times else 0) / 1e6)
+    return report
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = {op: float(weight) for op, weight in (item.split('=') for item in args.mix.split(','))}
+    server = None
+    host, port, unix = args.host, args.port, args.unix
+    if args.serve:
+        query_server = QueryServer(load_interval_tree(args.serve), args.window_ms / 1000)
+        server = await query_server.start(host, 0 if not unix else port, unix)
+        if not unix: port = server.sockets[0].getsockname()[1]
+    try: return await run_load(lambda: Client.connect(host, port, unix), args.connections, args.concurrency,
+                               args.requests, mix, args.k, args.seed)
+    finally:
+        if server:
+            server.close()
+            await server.wait_closed()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate load against server.py and report throughput and tail latency.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8351)
+    parser.add_argument('--unix', help="connect to this Unix socket path instead of TCP")
+    parser.add_argument('--serve', metavar='CSV', help="start a server for this CSV in-process first")
+    parser.add_argument('--window-ms', type=float, default=2.0, help="batching window of the --serve server")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8, help="requests kept in flight per connection")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--mix', default='search=70,range=10,count=10,top_k=5,bottom_k=5', help="op=weight,...")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=351)
+    parser.add_argument('--output', help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print(f"{report['requests']} requests ({report['errors']} errors) in {report['seconds']:.2f}s: "
+          f"{report['requests_per_sec']:,.0f} requests/s over {report['connections']}x{report['concurrency']} in flight")
+    for op, result in report['ops'].items():
+        print(f"  {op:<9} {result['count']:>8}  p50 {result['p50_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  max {result['max_ms']:>8.2f}ms")
+    print(f"  server: {report['server']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
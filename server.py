@@ -0,0 +1,166 @@
+from datastructures.ingest import IngestStats, load_interval_tree
+from datastructures.intervaltree import IntervalTree
+from datastructures.stock import Stock
+from typing import Any, Dict, List, Tuple
+import argparse
+import asyncio
+import json
+import os
+
+# A local query server: loads the interval tree once and answers line-delimited JSON over TCP or a Unix
+# socket, so consumers no longer each load the CSV. One JSON object per line each way:
+#
+#   {"id": 1, "op": "search", "point": 155}            {"id": 1, "results": [{...}, ...], "more": false}
+#   {"id": 2, "op": "range", "start": 155, "end": 200}
+#   {"id": 3, "op": "count", "point": 155}             {"id": 3, "count": 443}
+#   {"id": 4, "op": "count", "start": 155, "end": 200}
+#   {"id": 5, "op": "top_k", "k": 10}                  (bottom_k likewise)
+#   {"id": 6, "op": "stats"}                           {"id": 6, "stats": {...}}
+#
+# Results are streamed in chunks of chunk_size stocks, one line per chunk, with "more": true on all but
+# the last, so a large result starts arriving before it is fully serialized. Errors come back as
+# {"id": ..., "error": "..."}. Requests on one connection run concurrently and responses carry the
+# request's id, so they may arrive out of order.
+#
+# A request line longer than max_line bytes is discarded unread and answered with an error.
+#
+# Point searches and point counts that arrive within window seconds of each other, from any
+# connection, are coalesced and evaluated with one search_many/count_many sweep of the tree.
+#
+#   python server.py synthetic_stock_data.csv --port 8351
+
+def stock_json(stock: Stock) -> Dict[str, Any]:
+    return dict(symbol=stock.symbol, name=stock.name, low=stock.low, high=stock.high,
+                date=stock.date.isoformat() if stock.date else None)
+
+class QueryServer:
+    def __init__(self, tree: IntervalTree, window: float = 0.002, max_batch: int = 1024, chunk_size: int = 500,
+                 max_line: int = 65536):
+        self.tree = tree
+        self.window = window
+        self.max_batch = max_batch
+        self.chunk_size = chunk_size
+        self.max_line = max_line
+        self.stats = dict(connections=0, requests=0, errors=0, batches=0, batched_queries=0)
+        self._pending: Dict[str, Tuple[List[int], List[asyncio.Future]]] = {}   # 'search'/'count' -> the open batch
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8351, unix: str | None = None) -> asyncio.AbstractServer:
+        if unix: return await asyncio.start_unix_server(self._serve_client, unix, limit=self.max_line)
+        return await asyncio.start_server(self._serve_client, host, port, limit=self.max_line)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats['connections'] += 1
+        tasks = set()
+        skipping = False    # inside a line that overran max_line
+        try:
+            while True:
+                try: line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as error: line = error.partial   # a last line without a newline, or EOF
+                except asyncio.LimitOverrunError as error:
+                    await reader.readexactly(error.consumed)    # drop what is buffered of the line and keep reading past it
+                    skipping = True
+                    continue
+                if skipping:
+                    skipping = False
+                    self.stats['requests'] += 1
+                    self.stats['errors'] += 1
+                    self._send(writer, dict(id=None, error=f"ValueError: request line longer than {self.max_line} bytes"))
+                    await writer.drain()
+                    continue
+                if not line: break
+                task = asyncio.create_task(self._handle(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except ConnectionError: pass
+        finally:
+            for task in tasks: task.cancel()
+            writer.close()
+
+    async def _handle(self, line: bytes, writer: asyncio.StreamWriter) -> None:
+        self.stats['requests'] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict): raise ValueError("requests must be JSON objects")
+            request_id = request.get('id')
+            op = request.get('op')
+            if op == 'search': await self._stream(writer, request_id, await self._batched('search', int(request['point'])))
+            elif op == 'range': await self._stream(writer, request_id, self.tree.search(int(request['start']), int(request['end'])))
+            elif op == 'count':
+                if 'point' in request: count = await self._batched('count', int(request['point']))
+                else: count = self.tree.count_overlaps(int(request['start']), int(request['end']))
+                self._send(writer, dict(id=request_id, count=count))
+            elif op in ('top_k', 'bottom_k'): await self._stream(writer, request_id, getattr(self.tree, op)(int(request['k'])))
+            elif op == 'stats': self._send(writer, dict(id=request_id, stats=self.stats))
+            else: raise ValueError(f"unknown op {op!r}")
+        except ConnectionError: return     # the client went away mid-response
+        except Exception as error:      # bad requests (json.JSONDecodeError is a ValueError), but also e.g. OverflowError
+            self.stats['errors'] += 1
+            self._send(writer, dict(id=request_id, error=f"{type(error).__name__}: {error}"))
+        try: await writer.drain()
+        except ConnectionError: pass
+
+    async def _batched(self, kind: str, point: int) -> Any:
+        # joins the open batch of point queries of this kind, opening one (and its timer) if needed
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(kind)
+        if batch is None:
+            batch = self._pending[kind] = ([], [])
+            loop.call_later(self.window, self._flush, kind, batch)
+        future = loop.create_future()
+        batch[0].append(point)
+        batch[1].append(future)
+        if len(batch[0]) >= self.max_batch: self._flush(kind, batch)
+        return await future
+
+    def _flush(self, kind: str, batch: Tuple[List[int], List[asyncio.Future]]) -> None:
+        if self._pending.get(kind) is not batch: return    # already flushed when it filled up
+        del self._pending[kind]
+        points, futures = batch
+        self.stats['batches'] += 1
+        self.stats['batched_queries'] += len(points)
+        try: results = self.tree.search_many(points) if kind == 'search' else self.tree.count_many(points)
+        except Exception as error:
+            for future in futures:
+                if not future.done(): future.set_exception(error)
+            return
+        for future, result in zip(futures, results):
+            if not future.done(): future.set_result(result)
+
+    async def _stream(self, writer: asyncio.StreamWriter, request_id: Any, results: List[Stock]) -> None:
+        for first in range(0, max(len(results), 1), self.chunk_size):
+            chunk = [stock_json(stock) for stock in results[first:first + self.chunk_size]]
+            self._send(writer, dict(id=request_id, results=chunk, more=first + self.chunk_size < len(results)))
+            await writer.drain()
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, response: Dict[str, Any]) -> None:
+        writer.write(json.dumps(response).encode('utf-8') + b'\n')
+
+async def main(args: argparse.Namespace) -> None:
+    if args.snapshot: tree = IntervalTree.load(args.snapshot)
+    else:
+        stats = IngestStats()
+        tree = load_interval_tree(args.sources, stats=stats)
+        print(stats)
+    query_server = QueryServer(tree, args.window_ms / 1000, args.max_batch, args.chunk_size, args.max_line)
+    server = await query_server.start(args.host, args.port, args.unix)
+    print(f"serving on {args.unix or ', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve interval tree queries as line-delimited JSON.")
+    parser.add_argument('sources', nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synthetic_stock_data.csv')],
+                        help="CSV files to load (default: synthetic_stock_data.csv)")
+    parser.add_argument('--snapshot', help="load a snapshot written by IntervalTree.save instead of CSV")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8351)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--window-ms', type=float, default=2.0, help="how long point queries wait to be batched")
+    parser.add_argument('--max-batch', type=int, default=1024, help="evaluate a batch early once it has this many points")
+    parser.add_argument('--chunk-size', type=int, default=500, help="stocks per streamed result line")
+    parser.add_argument('--max-line', type=int, default=65536, help="longest request line accepted, in bytes")
+    try: asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt: pass